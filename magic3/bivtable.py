@@ -2,16 +2,66 @@
 # -*- coding:utf-8 -*-
 # author : cypro666
 # date   : 2015.06.06
+import os, csv, json, heapq, pickle, shutil, tempfile
 import _io
 from codecs import BOM_UTF8
+from itertools import islice, zip_longest
+from operator import itemgetter
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from magic3.utils import md5
 try:
     import numpy
+    from numpy.lib.stride_tricks import as_strided
 except Exception:
     raise ImportError('warning: numpy can Not be loaded!\n')
 
 
-def save_counter_as_csv(c:dict, filename:str, head=[]) -> int:
-    ''' Save counter into a csv file '''
+def _counter_lines(items) -> (bytes, int):
+    ''' Format (key, count) items as csv lines at once, rows failed to encode are skipped '''
+    try:
+        if all(k.__class__ is str for k, v in items):
+            return ''.join(['%d,%s\n' % (v, k) for k, v in items]).encode('utf-8'), len(items)
+        return b''.join([b'%d,%s\n' % (v, k.encode('utf-8') if isinstance(k, str) else k)
+                         for k, v in items]), len(items)
+    except UnicodeError:
+        lines = []
+        for k, v in items:
+            try:
+                lines.append(b'%d,%s\n' % (v, k.encode('utf-8') if isinstance(k, str) else k))
+            except UnicodeError as e:
+                print(e)
+        return b''.join(lines), len(lines)
+
+
+def _sorted_runs(c:dict, runsize:int, tmpdir=None) -> list:
+    ''' Sort items of `c` by value in runs of `runsize`, each run is pickled into a temp file by
+        batches, return the temp files '''
+    runs, items = [], iter(c.items())
+    for run in iter(lambda:list(islice(items, runsize)), []):
+        run.sort(key=itemgetter(1), reverse=True)
+        f = tempfile.TemporaryFile(dir=tmpdir)
+        for i in range(0, len(run), 65536):
+            pickle.dump(run[i:i + 65536], f, pickle.HIGHEST_PROTOCOL)
+        f.seek(0)
+        runs.append(f)
+    return runs
+
+
+def _load_run(f):
+    ''' Yield items of a run written by _sorted_runs '''
+    while True:
+        try:
+            yield from pickle.load(f)
+        except EOFError:
+            return
+
+
+def save_counter_as_csv(c:dict, filename:str, head=[], topn=None, batch=65536, runsize=None,
+                        tmpdir=None) -> int:
+    ''' Save counter into a csv file sorted by count, only the `topn` most common if given,
+        rows are written `batch` at a time, counters larger than `runsize` are sorted
+        externally, by merging sorted runs kept in temp files under `tmpdir` '''
     assert filename.endswith('.csv')
     nline = 0
 
@@ -20,34 +70,146 @@ def save_counter_as_csv(c:dict, filename:str, head=[]) -> int:
     except TypeError:
         header = ','.join(head).encode(encoding='utf-8')
 
-    with open(filename, 'wb') as fout:
-        fout.write(BOM_UTF8)
-        if header:
-            fout.write(header + b'\n')
-
-        for k in sorted(c, key=lambda x:c[x], reverse=True):
-            try:
-                if isinstance(k, str):
-                    fout.write(b'%d,%s\n' % (c[k], k.encode('utf-8')))
-                else:
-                    fout.write(b'%d,%s\n' % (c[k], k))
-
-                nline += 1
+    runs = []
+    if topn is not None:
+        items = iter(heapq.nlargest(topn, c.items(), key=itemgetter(1)))
+    elif runsize and len(c) > runsize:
+        runs = _sorted_runs(c, runsize, tmpdir)
+        items = heapq.merge(*map(_load_run, runs), key=itemgetter(1), reverse=True)
+    else:
+        items = iter(sorted(c.items(), key=itemgetter(1), reverse=True))
 
-            except UnicodeError as e:
-                print(e)
+    try:
+        with open(filename, 'wb') as fout:
+            fout.write(BOM_UTF8)
+            if header:
+                fout.write(header + b'\n')
+            for block in iter(lambda:list(islice(items, batch)), []):
+                data, n = _counter_lines(block)
+                fout.write(data)
+                nline += n
+    finally:
+        for f in runs:
+            f.close()
 
     return nline
 
 
-def read_csv(name:str, delim=',', withhead=False, strip=True, convert=None, encoding='utf-8', errors='strict') -> ([], []):
-    ''' Read csv file, return head and body as list '''
+def _read_head(f, delim:bytes, quoted=False) -> list:
+    line = next(f).rstrip()
+    if line.startswith(BOM_UTF8):
+        line = line[len(BOM_UTF8):]
+    if quoted:
+        return [i.decode() for i in split_quoted(line, delim)]
+    return [i.decode() for i in line.rstrip(b',').split(delim)]
+
+
+def _ends_quoted(line:bytes, delim:bytes) -> bool:
+    ''' Whether `line` ends inside a quoted field, a quote only opens at the start of a field
+        and two quotes in a quoted field are an escaped quote, as RFC-4180 and the csv module '''
+    pos, end, inside = 0, len(line), False
+    while pos < end:
+        if inside:
+            q = line.find(b'"', pos)
+            if q < 0:
+                return True
+            if line[q + 1:q + 2] == b'"':
+                pos = q + 2
+                continue
+            inside = False
+            pos = q + 1
+        elif line[pos:pos + 1] == b'"':
+            inside = True
+            pos += 1
+            continue
+        d = line.find(delim, pos)
+        if d < 0:
+            return False
+        pos = d + len(delim)
+    return inside
+
+
+def quoted_records(lines, delim:bytes) -> iter:
+    ''' Join raw lines into csv records, a line with quotes goes on with the next lines while it
+        ends inside a quoted field, other lines are passed through as they are '''
+    lines = iter(lines)
+    for line in lines:
+        if b'"' in line:
+            while _ends_quoted(line, delim):
+                more = next(lines, None)
+                if more is None:
+                    break
+                line += more
+        yield line
+
+
+def split_quoted(line:bytes, delim:bytes, maxsplit=-1) -> list:
+    ''' Split a raw record into raw fields, a record without quote is split directly, else it is
+        parsed by the csv module(RFC-4180), quotes are removed and escaped quotes unescaped '''
+    if b'"' not in line:
+        return line.rstrip(b'\r\n, ').split(delim, maxsplit)
+    text = line.rstrip(b'\r\n, ').decode('latin-1')
+    fields = next(csv.reader([text], delimiter=delim.decode('latin-1')), [])
+    return [f.encode('latin-1') for f in fields]
+
+
+def resolve_usecols(usecols, head:list) -> list:
+    ''' Make column indexes from names or indexes '''
+    cols = []
+    for c in usecols:
+        if isinstance(c, str):
+            if not head:
+                raise ValueError('column name %r needs withhead' % c)
+            c = head.index(c)
+        cols.append(c)
+    if not cols:
+        raise ValueError('usecols')
+    return cols
+
+
+def split_rows(lines, delim:bytes, usecols=None, predicate=None, quoted=False) -> list:
+    ''' Split raw lines into raw fields, if `usecols`(indexes) is given only those fields are kept
+        and the part after the last used field is never split, rows are dropped if
+        `predicate(fields)` is false, nothing is decoded here, if `quoted` lines should be
+        records(see quoted_records) and are split by split_quoted '''
+    if usecols is None:
+        if quoted:
+            rows = [split_quoted(line, delim) for line in lines]
+        else:
+            rows = [line.rstrip(b'"\r\n, ').split(delim) for line in lines]
+        return list(filter(predicate, rows)) if predicate else rows
+
+    maxsplit = max(usecols) + 1
+    pick = itemgetter(*usecols) if len(usecols) > 1 else (lambda seq, j=usecols[0]:(seq[j],))
+    rows = []
+    append = rows.append
+    for line in lines:
+        if quoted:
+            fields = split_quoted(line, delim, maxsplit)
+        else:
+            fields = line.rstrip(b'"\r\n, ').split(delim, maxsplit)
+        try:
+            fields = pick(fields)
+        except IndexError:
+            fields = tuple(fields[j] if j < len(fields) else b'' for j in usecols)
+        if predicate is None or predicate(fields):
+            append(fields)
+    return rows
+
+
+def read_csv(name:str, delim=',', withhead=False, strip=True, convert=None, encoding='utf-8', errors='strict',
+             usecols=None, predicate=None, quoted=False) -> ([], []):
+    ''' Read csv file, return head and body as list, only columns in `usecols`(names or indexes)
+        are decoded, `predicate` takes raw bytes fields(after usecols) and drops the row if false,
+        if `quoted` fields may be quoted as RFC-4180(with delimiters, quotes or newlines in),
+        lines without quote still take the plain split '''
+    chars = b' ' if quoted else b'" '
     if convert and strip:
-        make = lambda s: convert(s.strip(b'" ').decode(encoding, errors))
+        make = lambda s: convert(s.strip(chars).decode(encoding, errors))
     elif convert:
         make = lambda s: convert(s.decode(encoding, errors))
     elif strip:
-        make = lambda s: s.strip(b'" ').decode(encoding, errors)
+        make = lambda s: s.strip(chars).decode(encoding, errors)
     else:
         make = lambda s: s.decode(encoding, errors)
 
@@ -56,61 +218,921 @@ def read_csv(name:str, delim=',', withhead=False, strip=True, convert=None, enco
 
     if isinstance(name, str):
         name = _io.open(name, 'rb')
+    if quoted:
+        name = quoted_records(name, delim)
     if withhead:
-        line = next(name).rstrip()
-        head = [i.decode() for i in line.rstrip(b',').split(delim)]
-
-    for line in name:
-        body.append([make(i) for i in line.rstrip(b'"\r\n, ').split(delim)])
+        head = _read_head(name, delim, quoted)
+
+    if usecols is None and predicate is None:
+        if quoted:
+            for line in name:
+                body.append([make(i) for i in split_quoted(line, delim)])
+            return head, body
+        for line in name:
+            body.append([make(i) for i in line.rstrip(b'"\r\n, ').split(delim)])
+        return head, body
+
+    cols = resolve_usecols(usecols, head) if usecols is not None else None
+    if cols is not None and head:
+        head = [head[j] for j in cols]
+    for block in iter(lambda:list(islice(name, 65536)), []):
+        for fields in split_rows(block, delim, cols, predicate, quoted):
+            body.append([make(i) for i in fields])
 
     return head, body
 
 
-def write_csv(name:str, delim:str, body:list, head:list, body_format=None, head_format=None) -> int:
-    ''' Write data to csv file, note body should be a bivariate table '''
+def resolve_dtypes(dtypes, head:list, ncol:int) -> list:
+    ''' Make dtype of each column, `dtypes` is a single type for all columns, a list of types, or
+        a dict of {column name or index: type}, missing columns are str '''
+    if dtypes is None:
+        return [str] * ncol
+    if isinstance(dtypes, dict):
+        result = [str] * ncol
+        for k, t in dtypes.items():
+            j = head.index(k) if isinstance(k, str) else k
+            result[j] = t
+        return result
+    if isinstance(dtypes, (list, tuple)):
+        if len(dtypes) != ncol:
+            raise ValueError('expect %d dtypes, got %d' % (ncol, len(dtypes)))
+        return list(dtypes)
+    return [dtypes] * ncol
+
+
+def _sort_key(arr:numpy.ndarray) -> numpy.ndarray:
+    ''' Unicode arrays compare slowly, big-endian UCS4 viewed as bytes sorts in the same order '''
+    if arr.dtype.kind == 'U' and arr.dtype.itemsize:
+        return arr.astype('>U%d' % (arr.dtype.itemsize // 4)).view('S%d' % arr.dtype.itemsize)
+    return arr
+
+
+def to_column(values, dtype=str, strip=True, encoding='utf-8', errors='strict') -> numpy.ndarray:
+    ''' Convert a sequence of raw bytes fields into a typed numpy array at once,
+        str columns are decoded, bytes columns are kept raw, `strip` can also be the
+        bytes to strip(default quotes and spaces) '''
+    arr = numpy.array(values, dtype=bytes)
+    if strip:
+        arr = numpy.char.strip(arr, strip if isinstance(strip, bytes) else b'" ')
+    if dtype is str:
+        return numpy.char.decode(arr, encoding, errors)
+    if dtype is bytes:
+        return arr
+    return arr.astype(dtype)
+
+
+def parse_columns(lines, delim:bytes, ncol:int, dtypes:list, strip=True, encoding='utf-8', errors='strict',
+                  usecols=None, predicate=None, quoted=False) -> list:
+    ''' Split raw lines and convert them into one numpy array per column, short rows are padded,
+        `usecols`, `predicate` and `quoted` are the same as split_rows '''
+    rows = split_rows(lines, delim, usecols, predicate, quoted)
+    if quoted and strip:
+        strip = b' '
+    if not rows:
+        return [to_column([], dtypes[j], strip, encoding, errors) for j in range(ncol)]
+    columns = zip_longest(*rows, fillvalue=b'')
+    return [to_column(col, dtypes[j], strip, encoding, errors) for j, col in zip(range(ncol), columns)]
+
+
+class CSVChunks(object):
+    ''' Read csv by blocks of `chunksize` rows, each block is a list of numpy arrays(one per
+        column) typed by `dtypes`(see resolve_dtypes), `strip` and `encoding` are the same as
+        read_csv, blank lines are skipped, memory is bounded by `chunksize`, `usecols`, `predicate`
+        and `quoted` are the same as read_csv, `dtypes` refer to columns after `usecols`, eg:
+        chunks = CSVChunks('/data/huge.csv', withhead=True, dtypes={'price':float})
+        for cols in chunks:
+            total += cols[chunks.index('price')].sum()
+    '''
+
+    def __init__(self, name, delim=',', withhead=False, strip=True, dtypes=None, encoding='utf-8',
+                 errors='strict', chunksize=65536, usecols=None, predicate=None, quoted=False):
+        if chunksize <= 0:
+            raise ValueError('chunksize must be positive')
+        self._own = isinstance(name, str)
+        self._file = _io.open(name, 'rb') if self._own else name
+        self._delim = delim.encode()
+        self._strip = strip
+        self._encoding = encoding
+        self._errors = errors
+        self._chunksize = chunksize
+        self._dtypes = dtypes
+        self._predicate = predicate
+        self._quoted = quoted
+        if withhead:
+            lines = quoted_records(self._file, self._delim) if quoted else self._file
+            self.head = _read_head(lines, self._delim, quoted)
+        else:
+            self.head = []
+        self._usecols = resolve_usecols(usecols, self.head) if usecols is not None else None
+        if self._usecols is not None and self.head:
+            self.head = [self.head[j] for j in self._usecols]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excinst, exctb):
+        self.close()
+
+    def close(self):
+        if self._own:
+            self._file.close()
+
+    def index(self, colname) -> int:
+        return self.head.index(colname)
+
+    def __iter__(self):
+        lines = quoted_records(self._file, self._delim) if self._quoted else self._file
+        lines = (line for line in lines if line.strip())
+        ncol, dtypes = 0, None
+        try:
+            while True:
+                block = list(islice(lines, self._chunksize))
+                if not block:
+                    break
+                if not dtypes:
+                    if self.head:
+                        ncol = len(self.head)
+                    elif self._usecols is not None:
+                        ncol = len(self._usecols)
+                    else:
+                        ncol = len(split_rows(block[:1], self._delim, quoted=self._quoted)[0])
+                    dtypes = resolve_dtypes(self._dtypes, self.head, ncol)
+                cols = parse_columns(block, self._delim, ncol, dtypes, self._strip, self._encoding,
+                                     self._errors, self._usecols, self._predicate, self._quoted)
+                if len(cols[0]):
+                    yield cols
+        finally:
+            self.close()
+
+
+class CategoricalColumn(object):
+    ''' Dictionary-encoded string column, `codes` are int32 indexes into `categories` '''
+    __slots__ = ('codes', 'categories')
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, numpy.integer)):
+            return self.categories[self.codes[index]]
+        return CategoricalColumn(self.codes[index], self.categories)
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.decode()
+        return arr.astype(dtype) if dtype is not None else arr
+
+    def __repr__(self):
+        return '%s(%d rows, %d categories)' % (self.__class__.__name__, len(self.codes), len(self.categories))
+
+    @property
+    def dtype(self):
+        return self.categories.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.categories.nbytes
+
+    def decode(self) -> numpy.ndarray:
+        ''' Materialize as plain array of strings '''
+        return self.categories[self.codes]
+
+
+class CategoricalEncoder(object):
+    ''' Stable category -> integer code mappings of columns, learned incrementally from chunks
+        and tables and saved compactly, so codes stay the same across files, new categories get
+        the next codes(sorted within one chunk), unseen values are encoded as `unknown` and
+        NAFlag cells as `na`(set None to treat NAFlag as a normal category), eg:
+        enc = CategoricalEncoder.load('codes.npz') if exists('codes.npz') else CategoricalEncoder()
+        enc.fit_chunks(CSVChunks('/data/today.csv', withhead=True))
+        mat = enc.transform_table(table)
+        enc.save('codes.npz')
+    '''
+
+    def __init__(self, start=1, unknown=-1, na=0):
+        self.start = start
+        self.unknown = unknown
+        self.na = na
+        self.mappings = {}
+
+    def __len__(self):
+        return len(self.mappings)
+
+    def __contains__(self, key):
+        return key in self.mappings
+
+    def categories(self, key) -> numpy.ndarray:
+        ''' Categories of column `key` in code order '''
+        mapping = self.mappings.get(key, {})
+        return numpy.array(list(mapping)) if mapping else numpy.array([], dtype=str)
+
+    def transform(self, key, values, learn=False, dtype=numpy.int64) -> numpy.ndarray:
+        ''' Encode a column at once, only unique values are looked up, learn new ones if `learn` '''
+        mapping = self.mappings.setdefault(key, {}) if learn else self.mappings.get(key, {})
+        if isinstance(values, CategoricalColumn):
+            lookup = self.transform(key, values.categories, learn, dtype)
+            return lookup[values.codes]
+
+        values = numpy.asarray(values)
+        if not len(values):
+            return numpy.array([], dtype=dtype)
+        first, inverse = numpy.unique(_sort_key(values), return_index=True, return_inverse=True)[1:]
+        uniq = values[first].tolist()
+        if learn:
+            start, na = self.start, self.na
+            lookup = [na if na is not None and v == NAFlag else mapping.setdefault(v, start + len(mapping))
+                      for v in uniq]
+        else:
+            get, unknown = mapping.get, self.unknown
+            lookup = [get(v, unknown) for v in uniq]
+        codes = numpy.array(lookup, dtype=dtype)[inverse.ravel()]
+
+        if self.na is not None and values.dtype.kind in 'USO':
+            codes[values == NAFlag] = self.na
+        return codes
+
+    def partial_fit(self, key, values):
+        ''' Learn new categories of column `key` '''
+        self.transform(key, values, learn=True)
+        return self
+
+    def _table_columns(self, table) -> tuple:
+        if isinstance(table, BivTableBase) and table.columns is not None:
+            columns = table.columns
+        else:
+            columns = _as_cells(table).T
+        head = table.head if isinstance(table, BivTableBase) and table.head else []
+        return (head if head else list(range(len(columns)))), columns
+
+    def fit_chunks(self, chunks, keys=None):
+        ''' Learn from an iterable of column blocks, eg: CSVChunks, keys default to its head '''
+        if keys is None:
+            keys = getattr(chunks, 'head', None)
+        for cols in chunks:
+            for key, col in zip(keys if keys else range(len(cols)), cols):
+                self.transform(key, col, learn=True)
+        return self
+
+    def fit_table(self, table):
+        ''' Learn from a CSV/BivTable or 2-D array, keys are its head or column indexes '''
+        for key, col in zip(*self._table_columns(table)):
+            self.transform(key, col, learn=True)
+        return self
+
+    def transform_table(self, table, learn=False, dtype=numpy.int32) -> numpy.ndarray:
+        ''' Encode a whole table into a 2-D array of codes '''
+        keys, columns = self._table_columns(table)
+        mat = numpy.empty((len(columns[0]) if len(columns) else 0, len(columns)), dtype=dtype)
+        for j, (key, col) in enumerate(zip(keys, columns)):
+            mat[:, j] = self.transform(key, col, learn, dtype)
+        return mat
+
+    def save(self, filename):
+        ''' Save as compressed npz, categories of each column in code order '''
+        keys = list(self.mappings)
+        meta = {'start':self.start, 'unknown':self.unknown, 'na':self.na, 'keys':keys}
+        arrays = {'c%d' % i:self.categories(k) for i, k in enumerate(keys)}
+        numpy.savez_compressed(filename, meta=numpy.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with numpy.load(filename, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            encoder = cls(meta['start'], meta['unknown'], meta['na'])
+            for i, key in enumerate(meta['keys']):
+                cats = data['c%d' % i].tolist()
+                encoder.mappings[key] = dict(zip(cats, range(encoder.start, encoder.start + len(cats))))
+        return encoder
+
+
+class _CategoryBuilder(object):
+    ''' Encode string chunks into codes incrementally, only unique values of a chunk are hashed '''
+
+    def __init__(self):
+        self.encoder = CategoricalEncoder(start=0, na=None)
+        self.codes = []
+
+    def add(self, chunk):
+        self.codes.append(self.encoder.transform(0, chunk, learn=True, dtype=numpy.int32))
+
+    def merge(self, column:CategoricalColumn):
+        ''' Append an encoded column, only its categories are hashed '''
+        codes = self.encoder.transform(0, column.categories, learn=True, dtype=numpy.int32)
+        self.codes.append(codes[column.codes])
+
+    def build(self) -> CategoricalColumn:
+        categories = self.encoder.categories(0)
+        codes = numpy.concatenate(self.codes) if self.codes else numpy.array([], dtype=numpy.int32)
+        self.codes = []
+        return CategoricalColumn(codes, categories)
+
+
+class StringColumn(object):
+    ''' Read-only string column stored as int64 `offsets` into one `data` blob(uint8), both are
+        usually memory maps, strings are only decoded when they are accessed, utf-8 if `text`
+        else kept as bytes '''
+    __slots__ = ('offsets', 'data', 'text')
+
+    def __init__(self, offsets, data, text=True):
+        self.offsets = offsets
+        self.data = data
+        self.text = text
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _item(self, i):
+        item = self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+        return item.decode('utf-8') if self.text else item
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, numpy.integer)):
+            return self._item(range(self.__len__())[index])
+        if isinstance(index, slice) and index.step in (None, 1):
+            start, stop, _ = index.indices(self.__len__())
+            return StringColumn(self.offsets[start:max(start, stop) + 1], self.data, self.text)
+        items = [self._item(i) for i in numpy.arange(self.__len__())[index]]
+        return numpy.array(items, dtype=str if self.text else bytes)
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.decode()
+        return arr.astype(dtype) if dtype is not None else arr
+
+    def __repr__(self):
+        return '%s(%d rows, %d bytes)' % (self.__class__.__name__, self.__len__(), self.nbytes)
+
+    @property
+    def dtype(self):
+        ''' Unsized str or bytes dtype, the data is not touched '''
+        return numpy.dtype(str if self.text else bytes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets[-1] - self.offsets[0]) if len(self.offsets) else 0
+
+    def decode(self) -> numpy.ndarray:
+        ''' Materialize as plain array of strings(or bytes) '''
+        if not self.__len__():
+            return numpy.array([], dtype=str if self.text else bytes)
+        offsets = numpy.asarray(self.offsets)
+        blob = self.data[offsets[0]:offsets[-1]].tobytes()
+        bounds = (offsets - offsets[0]).tolist()
+        items = [blob[a:b] for a, b in zip(bounds, bounds[1:])]
+        if self.text:
+            return numpy.array([i.decode('utf-8') for i in items], dtype=str)
+        return numpy.array(items, dtype=bytes)
+
+
+class ColumnRows(object):
+    ''' Read-only row view over columns, used as `body` of a columnar BivTable '''
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    @property
+    def shape(self) -> tuple:
+        return (self.__len__(), len(self.columns))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ColumnRows([c[index] for c in self.columns])
+        return [c[index] for c in self.columns]
+
+    def blocks(self, step=65536):
+        ''' Yield rows as lists of tuples, `step` rows at a time '''
+        for i in range(0, self.__len__(), step):
+            block = [numpy.asarray(c[i:i + step]).tolist() for c in self.columns]
+            yield list(zip(*block))
+
+    def __iter__(self):
+        for block in self.blocks():
+            yield from map(list, block)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = numpy.column_stack([numpy.asarray(c) for c in self.columns])
+        return arr.astype(dtype) if dtype is not None else arr
+
+
+def shared_matrix(columns) -> numpy.ndarray:
+    ''' Return the 2-D array if every column is a view of one of its columns, else None, for
+        views of other buffers(eg. memory maps) laid out as a matrix, a 2-D view is made '''
+    first = columns[0] if columns else None
+    if not isinstance(first, numpy.ndarray) or first.ndim != 1 or first.base is None or not len(first):
+        return None
+    base = first.base
+    for c in columns:
+        if not isinstance(c, numpy.ndarray) or c.base is not base or c.dtype != first.dtype or \
+           c.shape != first.shape or c.strides != first.strides:
+            return None
+    step = columns[1].ctypes.data - first.ctypes.data if len(columns) > 1 else first.nbytes
+    if any(c.ctypes.data != first.ctypes.data + j * step for j, c in enumerate(columns)):
+        return None
+    if isinstance(base, numpy.ndarray) and base.shape == (len(first), len(columns)) and \
+       base.ctypes.data == first.ctypes.data and base.strides == (first.strides[0], step):
+        return base
+    return as_strided(first, shape=(len(first), len(columns)), strides=(first.strides[0], step),
+                      writeable=first.flags.writeable)
+
+
+def _join_parts(parts) -> list:
+    ''' Concatenate per-column parts(lists of arrays or _CategoryBuilder) into final columns,
+        numeric columns of one dtype share one Fortran-ordered 2-D array '''
+    kinds = set(p[0].dtype for p in parts if isinstance(p, list))
+    if len(kinds) == 1 and all(isinstance(p, list) for p in parts):
+        nrow = sum(len(c) for c in parts[0])
+        data = numpy.empty((nrow, len(parts)), dtype=kinds.pop(), order='F')
+        for j, part in enumerate(parts):
+            numpy.concatenate(part, out=data[:, j])
+            part.clear()
+        return [data[:, j] for j in range(len(parts))]
+
+    columns = []
+    for j, part in enumerate(parts):
+        columns.append(numpy.concatenate(part) if isinstance(part, list) else part.build())
+        parts[j] = None
+    return columns
+
+
+def read_columns(name, delim=',', withhead=False, strip=True, dtypes=None, encoding='utf-8',
+                 errors='strict', chunksize=65536, usecols=None, predicate=None, nproc=1,
+                 quoted=False) -> ([], []):
+    ''' Read csv into typed columns at read time(see CSVChunks), str/bytes columns are encoded as
+        CategoricalColumn, numeric columns of one dtype are views of one Fortran-ordered 2-D
+        array, so that both column access and to_array need no copy, if `nproc` > 1 and `name`
+        is a path, the file is parsed by a process pool(see read_columns_parallel), but not if
+        `quoted`, since a quoted field may hold newlines where the file would be split '''
+    if nproc > 1 and isinstance(name, str) and not quoted:
+        return read_columns_parallel(name, delim, withhead, strip, dtypes, encoding, errors,
+                                     chunksize, usecols, predicate, nproc)
+    reader = CSVChunks(name, delim, withhead, strip, dtypes, encoding, errors, chunksize, usecols, predicate,
+                       quoted)
+    parts = None
+    for cols in reader:
+        if parts is None:
+            parts = [_CategoryBuilder() if c.dtype.kind in 'US' else [] for c in cols]
+        for part, col in zip(parts, cols):
+            if isinstance(part, list):
+                part.append(col)
+            else:
+                part.add(col)
+
+    if not parts:
+        return reader.head, []
+    return reader.head, _join_parts(parts)
+
+
+def split_ranges(name:str, nparts:int, begin=0) -> list:
+    ''' Split file from offset `begin` into at most `nparts` (begin, end) byte ranges, each
+        range starts at the beginning of a line '''
+    if nparts <= 0:
+        raise ValueError('nparts must be positive')
+    size = os.path.getsize(name)
+    bounds = [begin]
+    with _io.open(name, 'rb') as f:
+        for i in range(1, nparts):
+            pos = begin + (size - begin) * i // nparts
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos - 1)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    if size > bounds[-1]:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _range_lines(f, begin:int, end:int, chunksize:int, blocksize=1 << 20):
+    ''' Yield non-blank lines of `f` in byte range [begin, end) as lists of at most `chunksize`,
+        reading `blocksize` bytes a time, so memory does not grow with the range '''
+    f.seek(begin)
+    remain = end - begin
+    rest, lines = b'', []
+    while remain > 0:
+        buf = f.read(min(remain, blocksize))
+        if not buf:
+            break
+        remain -= len(buf)
+        split = (rest + buf if rest else buf).split(b'\n')
+        rest = split.pop()
+        lines.extend(line for line in split if line.strip())
+        while len(lines) >= chunksize:
+            yield lines[:chunksize]
+            del lines[:chunksize]
+    if rest.strip():
+        lines.append(rest)
+    if lines:
+        yield lines
+
+
+def _parse_range(task) -> list:
+    ''' Worker of read_columns_parallel, parse lines in one byte range `chunksize` lines a time,
+        numeric columns are passed back through shared memory as (shm name, dtype, length) and
+        str columns as CategoricalColumn, return None if no row is parsed '''
+    name, begin, end, delim, ncol, dtypes, strip, encoding, errors, chunksize, usecols, predicate = task
+    parts = None
+    with _io.open(name, 'rb') as f:
+        for lines in _range_lines(f, begin, end, chunksize):
+            cols = parse_columns(lines, delim, ncol, dtypes, strip, encoding, errors, usecols, predicate)
+            if not len(cols[0]):
+                continue
+            if parts is None:
+                parts = [_CategoryBuilder() if c.dtype.kind in 'US' else [] for c in cols]
+            for part, col in zip(parts, cols):
+                if isinstance(part, list):
+                    part.append(col)
+                else:
+                    part.add(col)
+    if not parts:
+        return None
+
+    result = []
+    try:
+        for part in parts:
+            if not isinstance(part, list):
+                result.append(part.build())
+                continue
+            nrow = sum(len(c) for c in part)
+            shm = SharedMemory(create=True, size=max(nrow * part[0].dtype.itemsize, 1))
+            result.append((shm.name, part[0].dtype.str, nrow))
+            try:
+                numpy.concatenate(part, out=numpy.ndarray((nrow,), part[0].dtype, shm.buf))
+            finally:
+                part.clear()
+                shm.close()
+    except BaseException:
+        _unlink_blocks([result])
+        raise
+    return result
+
+
+def _unlink_blocks(results):
+    ''' Unlink shared memory blocks listed in results of _parse_range '''
+    for result in results:
+        for col in result or ():
+            if isinstance(col, tuple):
+                try:
+                    shm = SharedMemory(col[0])
+                except FileNotFoundError:
+                    continue
+                shm.close()
+                shm.unlink()
+
+
+def read_columns_parallel(name:str, delim=',', withhead=False, strip=True, dtypes=None, encoding='utf-8',
+                          errors='strict', chunksize=65536, usecols=None, predicate=None, nproc=None) -> ([], []):
+    ''' Same as read_columns, but split the file into newline-aligned byte ranges(see
+        split_ranges) parsed by `nproc`(default cpu count) processes, results are joined in
+        file order, so values are the same as read_columns while category codes may be numbered
+        differently, `predicate` must be picklable(a module level function) '''
+    nproc = nproc or os.cpu_count() or 1
+    bdelim = delim.encode()
+    head, ncol, begin = [], 0, 0
+    with _io.open(name, 'rb') as f:
+        if withhead:
+            head = _read_head(f, bdelim)
+            begin = f.tell()
+        cols = resolve_usecols(usecols, head) if usecols is not None else None
+        if cols is not None and head:
+            head = [head[j] for j in cols]
+        if head:
+            ncol = len(head)
+        elif cols is not None:
+            ncol = len(cols)
+        else:
+            first = next((line for line in f if line.strip()), b'')
+            ncol = len(first.rstrip(b'"\r\n, ').split(bdelim))
+    if not ncol:
+        return head, []
+
+    types = resolve_dtypes(dtypes, head, ncol)
+    tasks = [(name, b, e, bdelim, ncol, types, strip, encoding, errors, chunksize, cols, predicate)
+             for b, e in split_ranges(name, nproc, begin)]
+    if len(tasks) > 1:
+        # workers share the tracker of this process, so blocks they create are not reported
+        # as leaked when they exit, ownership passes to this process which unlinks them
+        resource_tracker.ensure_running()
+        results, error = [], None
+        with Pool(min(nproc, len(tasks))) as pool:
+            # wait for every task, so that blocks of finished ones can be unlinked on error
+            for pending in [pool.apply_async(_parse_range, (t,)) for t in tasks]:
+                try:
+                    results.append(pending.get())
+                except Exception as e:
+                    error = error or e
+        if error is not None:
+            _unlink_blocks(results)
+            raise error
+    else:
+        results = [_parse_range(t) for t in tasks]
+
+    shms = [SharedMemory(col[0]) for result in results if result for col in result
+            if isinstance(col, tuple)]
+    try:
+        attached, parts = iter(shms), None
+        for result in results:
+            if result is None:
+                continue
+            if parts is None:
+                parts = [_CategoryBuilder() if isinstance(c, CategoricalColumn) else [] for c in result]
+            for j, col in enumerate(result):
+                if isinstance(col, CategoricalColumn):
+                    parts[j].merge(col)
+                else:
+                    buf = next(attached).buf
+                    parts[j].append(numpy.ndarray((col[2],), numpy.dtype(col[1]), buf))
+        return head, _join_parts(parts) if parts else []
+    finally:
+        parts = buf = None
+        for shm in shms:
+            try:
+                shm.close()
+            except BufferError:
+                pass
+            shm.unlink()
+
+
+def _map_array(filename, dtype, shape, order='C') -> numpy.ndarray:
+    ''' Memory-map a raw array file read-only, empty arrays can not be mapped '''
+    dtype = numpy.dtype(dtype)
+    if not int(numpy.prod(shape)) or not dtype.itemsize:
+        return numpy.empty(shape, dtype=dtype, order=order)
+    return numpy.memmap(filename, dtype=dtype, mode='r', shape=shape, order=order)
+
+
+def _dump_strings(prefix, strings, blocksize=65536) -> bool:
+    ''' Save str or bytes array `strings` as int64 offsets(`prefix.off.bin`) into one blob
+        (`prefix.bin`), return True if they are str(saved as utf-8) '''
+    text = strings.dtype.kind == 'U'
+    offsets = numpy.zeros(len(strings) + 1, dtype=numpy.int64)
+    with open(prefix + '.bin', 'wb') as f:
+        for i in range(0, len(strings), blocksize):
+            items = strings[i:i + blocksize].tolist()
+            if text:
+                items = [s.encode('utf-8') for s in items]
+            numpy.cumsum([len(s) for s in items], out=offsets[i + 1:i + 1 + len(items)])
+            offsets[i + 1:i + 1 + len(items)] += offsets[i]
+            f.write(b''.join(items))
+    offsets.tofile(prefix + '.off.bin')
+    return text
+
+
+def _load_strings(prefix, n, text) -> StringColumn:
+    ''' Memory-map strings saved by _dump_strings '''
+    offsets = _map_array(prefix + '.off.bin', numpy.int64, (n + 1,))
+    return StringColumn(offsets, _map_array(prefix + '.bin', numpy.uint8, (int(offsets[-1]),)), text)
+
+
+def dump_columns(dirname, head, columns, extra=None):
+    ''' Save columns as raw array files plus a `header.json` into `dirname`, numeric columns
+        sharing one Fortran-ordered 2-D array are saved as one `matrix.bin`, strings(and
+        categories of categorical columns) as offsets into a data blob(see StringColumn), the
+        directory is written aside and renamed, so readers never see a half-written one '''
+    nrow = len(columns[0]) if columns else 0
+    header = {'head':list(head), 'nrow':nrow, 'ncol':len(columns), 'extra':extra or {}}
+    tmpdir = dirname.rstrip(os.sep) + '.tmp'
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir)
+
+    base = shared_matrix(columns)
+    if base is not None and base.dtype.kind in 'biufc':
+        with open(os.path.join(tmpdir, 'matrix.bin'), 'wb') as f:
+            numpy.asfortranarray(base).T.tofile(f)
+        header['layout'] = 'matrix'
+        header['dtype'] = base.dtype.str
+    else:
+        header['layout'] = 'columns'
+        header['columns'] = metas = []
+        for j, col in enumerate(columns):
+            prefix = os.path.join(tmpdir, 'c%d' % j)
+            if isinstance(col, CategoricalColumn):
+                col.codes.astype(numpy.int32).tofile(prefix + '.codes.bin')
+                text = _dump_strings(prefix + '.cats', numpy.asarray(col.categories))
+                metas.append({'kind':'categorical', 'text':text, 'ncat':len(col.categories)})
+                continue
+            col = numpy.asarray(col)
+            if col.dtype.kind == 'O':
+                col = col.astype(str)
+            if col.dtype.kind in 'US':
+                metas.append({'kind':'strings', 'text':_dump_strings(prefix, col)})
+            else:
+                numpy.ascontiguousarray(col).tofile(prefix + '.bin')
+                metas.append({'kind':'array', 'dtype':col.dtype.str})
+
+    with open(os.path.join(tmpdir, 'header.json'), 'w', encoding='utf-8') as f:
+        json.dump(header, f)
+
+    if os.path.exists(dirname):
+        shutil.rmtree(dirname)
+    os.replace(tmpdir, dirname)
+
+
+def load_columns(dirname) -> ([], [], {}):
+    ''' Load columns saved by dump_columns as read-only memory maps, return head, columns and
+        the header, only categories are decoded at once, string columns are StringColumn '''
+    with open(os.path.join(dirname, 'header.json'), 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    nrow, ncol = header['nrow'], header['ncol']
+
+    if header['layout'] == 'matrix':
+        data = _map_array(os.path.join(dirname, 'matrix.bin'), header['dtype'], (nrow, ncol), 'F')
+        return header['head'], [data[:, j] for j in range(ncol)], header
+
+    columns = []
+    for j, meta in enumerate(header['columns']):
+        prefix = os.path.join(dirname, 'c%d' % j)
+        if meta['kind'] == 'categorical':
+            codes = _map_array(prefix + '.codes.bin', numpy.int32, (nrow,))
+            if 'dtype' in meta:
+                # fixed width categories written by former versions
+                cats = _map_array(prefix + '.cats.bin', meta['dtype'], (meta['ncat'],))
+            else:
+                cats = _load_strings(prefix + '.cats', meta['ncat'], meta['text']).decode()
+            columns.append(CategoricalColumn(codes, cats))
+        elif meta['kind'] == 'strings':
+            columns.append(_load_strings(prefix, nrow, meta['text']))
+        else:
+            columns.append(_map_array(prefix + '.bin', meta['dtype'], (nrow,)))
+    return header['head'], columns, header
+
+
+def _dtype_key(dtypes):
+    ''' Json-able description of dtypes for cache keys '''
+    if dtypes is None or dtypes is str:
+        return 'str'
+    if dtypes is bytes:
+        return 'bytes'
+    if isinstance(dtypes, dict):
+        return {str(k):_dtype_key(v) for k, v in dtypes.items()}
+    if isinstance(dtypes, (list, tuple)):
+        return [_dtype_key(t) for t in dtypes]
+    return numpy.dtype(dtypes).str
+
+
+def read_columns_cached(name:str, delim=',', withhead=False, strip=True, dtypes=None, encoding='utf-8',
+                        errors='strict', chunksize=65536, cachedir=None, usecols=None, nproc=1,
+                        quoted=False) -> ([], []):
+    ''' Like read_columns, but keep a binary sidecar in `cachedir`(default `name + '.bivcache'`)
+        keyed by path, size, mtime and read options, later reads memory-map the sidecar
+        instead of parsing, a changed source file is parsed again, sidecars are named by path
+        and options, so one `cachedir` can be shared by many files '''
+    st = os.stat(name)
+    options = {'delim':delim, 'withhead':bool(withhead), 'strip':bool(strip),
+               'dtypes':_dtype_key(dtypes), 'encoding':encoding, 'errors':errors,
+               'usecols':list(usecols) if usecols is not None else None, 'quoted':bool(quoted)}
+    source = {'path':os.path.abspath(name), 'size':st.st_size, 'mtime':st.st_mtime_ns}
+    if not cachedir:
+        cachedir = name + '.bivcache'
+    path = os.path.join(cachedir, md5(json.dumps([source['path'], options], sort_keys=True).encode()))
+
+    if os.path.exists(os.path.join(path, 'header.json')):
+        head, columns, header = load_columns(path)
+        if header['extra'].get('source') == source and header['extra'].get('options') == options:
+            return head, columns
+
+    head, columns = read_columns(name, delim, withhead, strip, dtypes, encoding, errors, chunksize, usecols,
+                                 nproc=nproc, quoted=quoted)
+    dump_columns(path, head, columns, {'source':source, 'options':options})
+    return head, columns
+
+
+def _row_blocks(body, chunksize:int):
+    ''' Yield `body` as lists of rows, at most `chunksize` rows each, arrays are converted
+        blockwise by tolist and iterators are consumed lazily, arrays of float32 and other
+        non-native floats keep numpy scalars, whose str is the shortest repr of that type '''
+    if isinstance(body, ColumnRows):
+        yield from body.blocks(chunksize)
+    elif isinstance(body, numpy.ndarray):
+        native = body.dtype.kind in 'biuOUS' or body.dtype == numpy.float64
+        for i in range(0, len(body), chunksize):
+            block = numpy.asarray(body[i:i + chunksize])
+            yield block.tolist() if native else list(block)
+    elif isinstance(body, (list, tuple)):
+        for i in range(0, len(body), chunksize):
+            yield body[i:i + chunksize]
+    else:
+        it = iter(body)
+        block = list(islice(it, chunksize))
+        while block:
+            yield block
+            block = list(islice(it, chunksize))
+
+
+def write_csv(name:str, delim:str, body:list, head:list, body_format=None, head_format=None,
+              chunksize=65536) -> int:
+    ''' Write data to csv file, note body should be a bivariate table, a 2-D array, a columnar
+        body or any iterator of rows, formatting and writing is done `chunksize` rows a time '''
     if not head_format:
         head_format = (delim).join(['%s'] * len(head)) + '\n'
     elif not head_format.endswith('\n'):
         head_format += '\n'
+    if body_format and body_format.endswith('\n'):
+        body_format = body_format[:-1]
 
-    if not body_format:
-        try:
-            body_format = delim.join(['%s'] * len(body[0])) + '\n'
-        except TypeError:
-            try:
-                body_format = delim.join(['%s'] * numpy.shape(body)[1]) + '\n'
-            except IndexError:
-                body_format = delim.join(['%s'] * numpy.shape(body)[0]) + '\n'
-    elif not body_format.endswith('\n'):
-        body_format += '\n'
-
-    with _io.open(name, 'wb') as fout:
+    nlines = 0
+    with _io.open(name, 'wb', buffering=1 << 20) as fout:
         fout.write(BOM_UTF8)
-
-    with _io.open(name, 'a', encoding='utf-8') as fout:
-        nlines = 0
         if head:
             nlines += 1
-            fout.write(head_format % tuple(head))
-        if len(numpy.shape(body)) == 1:
-            for i in body:
-                fout.write('%s\n' % i)
-                nlines += 1
-        else:
-            for row in body:
-                fout.write(body_format % tuple(row))
-                nlines += 1
+            fout.write((head_format % tuple(head)).encode('utf-8'))
+        flat = None
+        for block in _row_blocks(body, chunksize):
+            if flat is None:
+                flat = not isinstance(block[0], (list, tuple, numpy.ndarray))
+                if not flat and not body_format:
+                    body_format = delim.join(['%s'] * len(block[0]))
+            if flat:
+                text = '\n'.join(map(str, block))
+            else:
+                text = '\n'.join([body_format % tuple(row) for row in block])
+            fout.write(text.encode('utf-8'))
+            fout.write(b'\n')
+            nlines += len(block)
 
     return nlines
 
 
+def _fill(out, index, block) -> numpy.ndarray:
+    ''' Assign `block` to out[index], `out` is widened first if `block` needs a wider dtype '''
+    wider = numpy.result_type(out.dtype, block.dtype)
+    if wider != out.dtype:
+        out = out.astype(wider, order='K')
+    out[index] = block
+    return out
+
+
+def _stack_rows(rows:list, dtype=None, chunksize=65536) -> numpy.ndarray:
+    ''' Convert list of rows into a preallocated array `chunksize` rows a time '''
+    if not rows:
+        return numpy.array(rows, dtype=dtype)
+    out = None
+    for start in range(0, len(rows), chunksize):
+        block = numpy.array(rows[start:start + chunksize], dtype=dtype)
+        if out is None:
+            out = numpy.empty((len(rows),) + block.shape[1:], dtype=block.dtype)
+        elif block.shape[1:] != out.shape[1:]:
+            raise ValueError('rows are not of the same length')
+        out = _fill(out, slice(start, start + len(block)), block)
+    return out
+
+
+def _stack_columns(columns:list, dtype=None) -> numpy.ndarray:
+    ''' Fill columns into a Fortran-ordered 2-D array one by one '''
+    out = None
+    for j in range(len(columns)):
+        col = numpy.asarray(columns[j], dtype=dtype)
+        if out is None:
+            out = numpy.empty((len(col), len(columns)), dtype=col.dtype, order='F')
+        out = _fill(out, (slice(None), j), col)
+    return out if out is not None else numpy.empty((0, 0), dtype=dtype)
+
+
 class BivTableBase(object):
     ''' Base class of bivariate table '''
+
+    # typed columns in columnar mode, else None
+    columns = None
+
     def __init__(self, head=[], body=[]):
         self.check(head, body)
         self.head = head
         self.body = body
 
+    @property
+    def columnar(self) -> bool:
+        return self.columns is not None
+
+    def set_columns(self, head, columns):
+        ''' Switch to columnar mode, `body` becomes the shared 2-D array if all columns are
+            views of it, else a ColumnRows '''
+        base = shared_matrix(columns)
+        body = base if base is not None else ColumnRows(columns)
+        self.head, self.body, self.columns = list(head), body, list(columns)
+
+    def column(self, key):
+        ''' Get column by index or name, no copy in columnar mode '''
+        j = self.head.index(key) if isinstance(key, str) else key
+        if self.columns is not None:
+            return self.columns[j]
+        return [row[j] for row in self.body]
+
     @property
     def header(self) -> list:
         return self.head
@@ -135,24 +1157,46 @@ class BivTableBase(object):
         ''' Body iterator '''
         return iter(self.body)
 
+    def to_columns(self) -> list:
+        ''' Return one array per column, the columns themselves in columnar mode, views of an
+            array body, else built from rows '''
+        if self.columns is not None:
+            return self.columns
+        if isinstance(self.body, numpy.ndarray):
+            body = numpy.asarray(self.body)
+            return [body[:, j] for j in range(body.shape[1])]
+        return [numpy.array(col) for col in zip(*self.body)]
+
+    def groupby(self, keys):
+        ''' Group by key columns(names or indexes), see GroupBy '''
+        return GroupBy(self, keys)
+
     def reset(self):
         ''' Clear and reset all '''
         self.head.clear()
         del self.head
-        self.body.clear()
+        if isinstance(self.body, list):
+            self.body.clear()
         del self.body
-        self.head, self.body = [], []
-
-    def to_matrix(self, deleteRaw=False) -> numpy.mat:
-        ''' Return a numpy matrix object '''
-        mat = numpy.mat(self.body)
-        if deleteRaw:
-            self.reset()
-        return mat
-
-    def to_array(self, deleteRaw=False) -> numpy.array:
-        ''' Return a numpy ndarray object '''
-        narr = numpy.array(self.body)
+        self.head, self.body, self.columns = [], [], None
+
+    def to_matrix(self, deleteRaw=False, dtype=None, chunksize=65536) -> numpy.mat:
+        ''' Return a numpy matrix object, see to_array '''
+        return numpy.asmatrix(self.to_array(deleteRaw, dtype, chunksize))
+
+    def to_array(self, deleteRaw=False, dtype=None, chunksize=65536) -> numpy.array:
+        ''' Return a numpy ndarray object, no copy if the body is an array or columns share one,
+            else it is filled into preallocated storage `chunksize` rows(or one column) a time,
+            if `deleteRaw` the table is reset once conversion succeeded '''
+        body = self.body
+        if isinstance(body, numpy.ndarray):
+            narr = numpy.asarray(body, dtype=dtype)
+        elif self.columns is not None:
+            narr = _stack_columns(self.columns, dtype)
+        elif isinstance(body, list):
+            narr = _stack_rows(body, dtype, chunksize)
+        else:
+            narr = numpy.array(body, dtype=dtype)
         if deleteRaw:
             self.reset()
         return narr
@@ -168,25 +1212,71 @@ class BivTable(BivTableBase):
     def __init__(self, head=[], body=[]):
         super().__init__(head, body)
 
-    def read(self, name, delim=',', withhead=False, strip=False, convert=None, encoding='utf-8'):
-        ''' Read from file, `convert` should be a function like int/str/float/lambda '''
-        self.head, self.body = read_csv(name, delim, withhead, strip, convert, encoding)
+    def read(self, name, delim=',', withhead=False, strip=False, convert=None, encoding='utf-8',
+             columnar=False, dtypes=None, chunksize=65536, cache=False, usecols=None, predicate=None,
+             nproc=1, quoted=False):
+        ''' Read from file, `convert` should be a function like int/str/float/lambda,
+            if `columnar` is True, store typed columns(see read_columns), `convert` must then
+            be a type and `dtypes` defaults to it, `cache` implies `columnar` and keeps a binary
+            sidecar of the file(see read_columns_cached), `cache` can also be the cache directory,
+            `usecols`, `predicate` and `quoted` are the same as read_csv, `predicate` can not be
+            cached, `nproc` > 1 also implies `columnar` and parses the file in that many processes '''
+        if nproc > 1 and isinstance(name, str):
+            columnar = True
+        if cache and isinstance(name, str):
+            if predicate is not None:
+                raise ValueError('predicate can not be cached')
+            columnar = True
+        if columnar:
+            if convert is not None and not isinstance(convert, type):
+                raise ValueError('columnar read takes a type as convert, use dtypes for columns')
+            if dtypes is None and convert is not None:
+                dtypes = convert
+            if cache and isinstance(name, str):
+                head, columns = read_columns_cached(name, delim, withhead, strip, dtypes, encoding,
+                                                    chunksize=chunksize,
+                                                    cachedir=cache if isinstance(cache, str) else None,
+                                                    usecols=usecols, nproc=nproc, quoted=quoted)
+            else:
+                head, columns = read_columns(name, delim, withhead, strip, dtypes, encoding,
+                                             chunksize=chunksize, usecols=usecols, predicate=predicate,
+                                             nproc=nproc, quoted=quoted)
+            self.set_columns(head, columns)
+        else:
+            self.columns = None
+            self.head, self.body = read_csv(name, delim, withhead, strip, convert, encoding,
+                                            usecols=usecols, predicate=predicate, quoted=quoted)
         self.check(self.head, self.body)
 
     def check(self, head, body):
         ''' Check types '''
         if not isinstance(head, (list, tuple)):
             raise TypeError
-        if not isinstance(body, (list, tuple, set, numpy.matrix, numpy.ndarray)):
+        if not isinstance(body, (list, tuple, set, numpy.matrix, numpy.ndarray, ColumnRows)):
             raise TypeError
 
-    def write(self, name, delim=',', body_format=None, head_format=None):
+    def write(self, name, delim=',', body_format=None, head_format=None, chunksize=65536):
         ''' Write data to csv file '''
-        return write_csv(name, delim, self.body, self.head, body_format, head_format)
+        return write_csv(name, delim, self.body, self.head, body_format, head_format, chunksize)
+
+    def save_binary(self, path):
+        ''' Save as a directory of typed column files with a json header(see dump_columns) '''
+        dump_columns(path, self.head, self.to_columns())
+
+    @classmethod
+    def open_binary(cls, path):
+        ''' Open a table saved by save_binary in columnar mode, columns are read-only memory maps
+            shared by all processes opening it, only pages of used columns are read '''
+        head, columns, header = load_columns(path)
+        table = cls()
+        table.set_columns(head, columns)
+        return table
 
     @property
     def shape(self) -> tuple:
         ''' Number of rows and cols '''
+        if self.columns is not None:
+            return len(self.body), len(self.columns)
         if self.head:
             assert len(self.head) == len(self.body[0])
         return len(self.body), len(self.body[0])
@@ -214,25 +1304,60 @@ def indexed(vec, start, offset=1) -> dict:
     ''' Indexed an array-like object(list,tuple,etc) by integer, auto increment '''
     assert hasattr(vec, '__iter__')
     assert isinstance(vec, (tuple, list, numpy.ndarray))
-    vec = list(set(vec))
-    vec.sort()
+    arr = None
+    # numpy sorts flat arrays of one element type, anything it would coerce keeps the set path
+    if isinstance(vec, numpy.ndarray) or len(set(map(type, vec))) == 1:
+        try:
+            arr = numpy.asarray(vec)
+        except ValueError:
+            pass
+    if arr is not None and arr.ndim == 1 and arr.dtype.kind != 'O':
+        vec = numpy.unique(arr).tolist()
+    else:
+        vec = list(set(vec))
+        vec.sort()
     end = len(vec) * 2 + start
     return {k:v for k, v in zip(vec, range(start, end, offset))}
 
+def _as_cells(table) -> numpy.ndarray:
+    ''' Get 2-D array of a CSV/BivTable or array-like table, no copy if possible '''
+    if isinstance(table, BivTableBase):
+        table = table.body
+    return numpy.asarray(table)
+
+def _na_mask(arr:numpy.ndarray):
+    ''' Cells equal to NAFlag, None if no string cell at all '''
+    if arr.dtype.kind not in 'USO':
+        return None
+    return arr == NAFlag
+
+def _sorted_codes(col) -> numpy.ndarray:
+    ''' Rank of each cell among sorted unique values of `col` '''
+    if isinstance(col, CategoricalColumn):
+        uniq, inverse = numpy.unique(_sort_key(col.categories), return_inverse=True)
+        return inverse.ravel()[col.codes]
+    return numpy.unique(_sort_key(numpy.asarray(col)), return_inverse=True)[1].ravel()
+
 def indexed_by_column(table:CSV, dtype=float, start=1, NA=0) -> numpy.mat:
     '''[['a', 'b', 'c'],      [[1.  2.  3.]
         ['e', 'a', 'd'],  =>   [3.  1.  2.]
         ['f', 'f', 'b'],       [2.  2.  1.]
         ['a', 'c', 'd'],       [1.  2.  3.]]
     '''
-    nr, nc = table.shape
+    if isinstance(table, BivTableBase) and table.columns is not None:
+        columns = table.columns
+    else:
+        columns = _as_cells(table).T
+    nr, nc = len(columns[0]) if len(columns) else 0, len(columns)
     mat = numpy.zeros(shape=(nr, nc), dtype=dtype)
-    dtmp = [indexed(i, start=start) for i in table.T]
 
-    for i in range(nr):
-        row = table[i]
-        for j in range(nc):
-            mat[i, j] = dtmp[j][row[j]] if row[j] != NAFlag else NA
+    for j, col in enumerate(columns):
+        mat[:, j] = _sorted_codes(col) + start
+        mask = _na_mask(numpy.asarray(col.categories if isinstance(col, CategoricalColumn) else col))
+        if mask is not None:
+            if isinstance(col, CategoricalColumn):
+                mask = mask[col.codes]
+            mat[mask, j] = NA
 
     return mat
 
@@ -242,34 +1367,42 @@ def indexed_by_row(table:CSV, dtype=float, start=1, NA=0) -> numpy.mat:
         ['f', 'f', 'b'],       [3.  4.  1.]
         ['a', 'c', 'd'],       [1.  3.  3.]]
     '''
-    nr, nc = table.shape
+    arr = _as_cells(table)
+    nr, nc = arr.shape
     mat = numpy.zeros(shape=(nr, nc), dtype=dtype)
-    dtmp = [indexed(i, start=start) for i in table]
+    if not arr.size:
+        return mat
+
+    # sort each row, count distinct values seen so far as rank, then scatter ranks back
+    key = _sort_key(arr)
+    order = numpy.argsort(key, axis=1, kind='stable')
+    ordered = numpy.take_along_axis(key, order, axis=1)
+    ranks = numpy.zeros(shape=(nr, nc), dtype=numpy.int64)
+    numpy.cumsum(ordered[:, 1:] != ordered[:, :-1], axis=1, out=ranks[:, 1:])
+    numpy.put_along_axis(mat, order, ranks + start, axis=1)
 
-    for i in range(nr):
-        row = table[i]
-        for j in range(nc):
-            mat[i, j] = dtmp[i][row[j]] if row[j] != NAFlag else NA
+    mask = _na_mask(arr)
+    if mask is not None:
+        mat[mask] = NA
 
     return mat
 
 def indexed_all(table:CSV, dtype=float, start=1, NA=0) -> numpy.mat:
-    d = {}
-    n = start
-
-    for row in table:
-        for k in row:
-            if k not in d:
-                d[k] = n
-                n += 1
-
-    nr, nc = table.shape
+    ''' Indexed all cells by one mapping, values are numbered in order of first appearance '''
+    arr = _as_cells(table)
+    nr, nc = arr.shape
     mat = numpy.zeros(shape=(nr, nc), dtype=dtype)
+    if not arr.size:
+        return mat
+
+    uniq, first, inverse = numpy.unique(_sort_key(arr).ravel(), return_index=True, return_inverse=True)
+    rank = numpy.empty(len(uniq), dtype=numpy.int64)
+    rank[numpy.argsort(first)] = numpy.arange(start, start + len(uniq))
+    mat[:] = rank[inverse.ravel()].reshape(nr, nc)
 
-    for i in range(nr):
-        row = table[i]
-        for j in range(nc):
-            mat[i, j] = d[row[j]] if row[j] != NAFlag else NA
+    mask = _na_mask(arr)
+    if mask is not None:
+        mat[mask] = NA
 
     return mat
 
@@ -282,6 +1415,150 @@ def quantize(arr, mapper, unique=True) -> dict:
     return {k:mapper(k) for k in arr}
 
 
+
+# aggregate functions of GroupBy.agg
+AGG_FUNCS = ('count', 'sum', 'mean', 'min', 'max', 'distinct')
+
+def _group_index(keys) -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+    ''' Number rows by `keys` columns, return (order, starts, counts), `order` sorts rows by
+        group, groups are sorted by keys, rows of group i are order[starts[i]:][:counts[i]] '''
+    gid = None
+    for col in keys:
+        codes = _sorted_codes(col)
+        gid = codes if gid is None else gid * (int(codes.max()) + 1) + codes
+        if gid is codes and not isinstance(col, CategoricalColumn):
+            continue
+        span = int(gid.max()) + 1
+        if span <= 4 * len(gid):
+            # renumber by a lookup table rather than sorting
+            remap = numpy.cumsum(numpy.bincount(gid, minlength=span) > 0) - 1
+            gid = remap[gid]
+        else:
+            gid = numpy.unique(gid, return_inverse=True)[1].ravel()
+    counts = numpy.bincount(gid)
+    starts = numpy.zeros(len(counts), dtype=numpy.int64)
+    numpy.cumsum(counts[:-1], out=starts[1:])
+    # stable argsort of 16 bits or narrower integers is a radix sort
+    if len(counts) <= 1 << 16:
+        gid = gid.astype(numpy.uint16 if len(counts) > 1 << 8 else numpy.uint8)
+    return numpy.argsort(gid, kind='stable'), starts, counts
+
+def _reduce(func, col, order, starts, counts) -> numpy.ndarray:
+    ''' Apply aggregate `func` on each group of `col`, see _group_index '''
+    if func == 'count':
+        return counts
+    if func in ('min', 'max', 'distinct'):
+        ranks = _sorted_codes(col)
+        nvalue = int(ranks.max()) + 1
+        if func == 'distinct':
+            pairs = numpy.repeat(numpy.arange(len(counts)), counts) * nvalue + ranks[order]
+            return numpy.bincount(numpy.unique(pairs) // nvalue, minlength=len(counts))
+        ufunc = numpy.minimum if func == 'min' else numpy.maximum
+        rowof = numpy.empty(nvalue, dtype=numpy.int64)
+        rowof[ranks] = numpy.arange(len(ranks))
+        return col[rowof[ufunc.reduceat(ranks[order], starts)]]
+    values = numpy.asarray(col)[order]
+    if func == 'sum':
+        return numpy.add.reduceat(values, starts)
+    if func == 'mean':
+        return numpy.add.reduceat(values, starts, dtype=numpy.float64) / counts
+    raise ValueError('unknown aggregate function %r' % func)
+
+def _aggregate(keys, columns, funcs) -> (list, list):
+    ''' Group rows by `keys` columns and apply funcs[i] on columns[i], return key values and
+        aggregates of groups '''
+    order, starts, counts = _group_index(keys)
+    first = order[starts]
+    return [k[first] for k in keys], [_reduce(f, c, order, starts, counts) for f, c in zip(funcs, columns)]
+
+
+class GroupBy(object):
+    ''' Vectorized group-by, groups are sorted by keys, eg:
+        table.groupby(['city']).agg({'price':['sum', 'mean'], 'user':'distinct'})
+        `source` is a BivTable, or an iterable of column blocks like CSVChunks for files
+        larger than memory, then only per-group partial aggregates are kept between blocks '''
+
+    def __init__(self, source, keys, head=None):
+        self.source = source
+        self.head = list(head if head is not None else getattr(source, 'head', []))
+        if isinstance(keys, (str, int)):
+            keys = [keys]
+        self.keys = resolve_usecols(keys, self.head)
+
+    def _name(self, j) -> str:
+        return self.head[j] if self.head else str(j)
+
+    def _tasks(self, spec) -> list:
+        tasks = []
+        for key, funcs in spec.items():
+            j = resolve_usecols([key], self.head)[0]
+            for f in [funcs] if isinstance(funcs, str) else funcs:
+                if f not in AGG_FUNCS:
+                    raise ValueError('unknown aggregate function %r' % f)
+                tasks.append((j, f))
+        return tasks
+
+    def agg(self, spec:dict):
+        ''' Aggregate by `spec` like {column:func or [funcs]}, funcs are in AGG_FUNCS, return a
+            columnar BivTable of key columns and one column named 'column_func' per func '''
+        tasks = self._tasks(spec)
+        if isinstance(self.source, BivTableBase):
+            columns = self.source.to_columns()
+            if not columns or not len(columns[0]):
+                raise ValueError('no rows')
+            keys, results = _aggregate([columns[k] for k in self.keys], [columns[j] for j, f in tasks],
+                                       [f for j, f in tasks])
+        else:
+            keys, results = self._agg_blocks(tasks)
+
+        table = BivTable()
+        table.set_columns([self._name(k) for k in self.keys] +
+                          ['%s_%s' % (self._name(j), f) for j, f in tasks], keys + results)
+        return table
+
+    def _agg_blocks(self, tasks) -> (list, list):
+        ''' Aggregate block by block, mean is kept as sum and count, distinct as unique
+            (keys, value) rows, partials of each block are merged into those of former ones '''
+        nkey = len(self.keys)
+        parts = []
+        for j, f in tasks:
+            if f == 'mean':
+                parts.extend([(j, 'sum'), (j, 'count')])
+            elif f != 'distinct':
+                parts.append((j, f))
+        merge = ['sum' if f == 'count' else f for j, f in parts]
+        state, seen = None, {j:None for j, f in tasks if f == 'distinct'}
+
+        def merged(old, new):
+            return new if old is None else [numpy.concatenate([a, b]) for a, b in zip(old, new)]
+
+        for cols in self.source:
+            keys = [numpy.asarray(cols[k]) for k in self.keys]
+            if not len(keys[0]):
+                continue
+            gkeys, results = _aggregate(keys, [cols[j] for j, f in parts], [f for j, f in parts])
+            if state is not None:
+                both = merged(state, gkeys + results)
+                gkeys, results = _aggregate(both[:nkey], both[nkey:], merge)
+            state = gkeys + results
+            for j in seen:
+                rows = _aggregate(merged(seen[j], keys + [numpy.asarray(cols[j])]), [], [])[0]
+                seen[j] = rows
+
+        if state is None:
+            raise ValueError('no rows')
+        found = dict(zip(parts, state[nkey:]))
+        results = []
+        for j, f in tasks:
+            if f == 'mean':
+                results.append(found[(j, 'sum')] / found[(j, 'count')])
+            elif f == 'distinct':
+                results.append(_group_index(seen[j][:nkey])[2])
+            else:
+                results.append(found[(j, f)])
+        return state[:nkey], results
+
+
 def test():
     from _io import BytesIO
     s = b'''a,b,c,d,e,f,g,h,j,k 
@@ -304,6 +1581,147 @@ def test():
         pass
 
     csv.write('csv.csv', delim=',', body_format=','.join(['%.2f'] * 10))
+
+    rows = [list(r) for r in csv.body]
+    narr = csv.to_array(deleteRaw=True, dtype=numpy.int64, chunksize=4)
+    assert narr.dtype == numpy.int64 and narr.tolist() == rows and csv.body == []
+    csv = CSV(['a', 'b'], narr[:, :2])
+    assert numpy.shares_memory(csv.to_array(), narr) and csv.to_matrix().shape == (6, 2)
+    for f32 in (numpy.array([[0.1, 0.2]], dtype=numpy.float32), numpy.array([0.1, 0.2], dtype=numpy.float32)):
+        write_csv('csv.csv', ',', f32, [])
+        with open('csv.csv', 'rb') as f:
+            assert f.read() == BOM_UTF8 + (b'0.1,0.2\n' if f32.ndim == 2 else b'0.1\n0.2\n')
+        back = BivTable()
+        back.read('csv.csv', convert=numpy.float32, encoding='utf-8-sig')
+        assert (numpy.array(back.body, dtype=numpy.float32).reshape(f32.shape) == f32).all()
+    farr = numpy.array([[1.5, 2.5], [3.5, 4.5]])
+    assert CSV(['a', 'b'], farr).to_array(deleteRaw=True, dtype=numpy.int64).tolist() == [[1, 2], [3, 4]]
+    assert farr.tolist() == [[1.5, 2.5], [3.5, 4.5]]
+    bad = CSV(['a'], [['x']] + [[str(i)] for i in range(9)])
+    try:
+        bad.to_array(deleteRaw=True, dtype=int, chunksize=3)
+        assert False
+    except ValueError:
+        assert len(bad.body) == 10
+    bad.read(BytesIO(b'a,b\n1,x\n2,y\n'), withhead=1, dtypes={'a':int}, columnar=True)
+    try:
+        bad.to_array(deleteRaw=True, dtype=int)
+        assert False
+    except ValueError:
+        assert list(bad.column('b')) == ['x', 'y'] and len(bad.body) == 2
+
+    chunks = CSVChunks(BytesIO(s), withhead=1, dtypes={'a':int, 'k':float}, chunksize=4)
+    blocks = list(chunks)
+    assert [len(b[0]) for b in blocks] == [4, 2]
+    assert blocks[0][0].dtype.kind == 'i' and blocks[1][9].dtype.kind == 'f'
+    assert list(blocks[1][1]) == ['2', '6']
+
+    csv.read(BytesIO(s), withhead=1, strip=True, convert=int, columnar=True)
+    assert csv.to_array() is csv.body and csv.column('b').base is csv.body
+    assert csv.shape == (6, 10) and csv[1][1] == 9
+    csv.read(BytesIO(s), withhead=1, strip=True, dtypes={'a':float}, columnar=True)
+    assert isinstance(csv.column('b'), CategoricalColumn)
+    assert list(csv.column('b')) == ['2', '9', '2', '9', '2', '6'] and csv[5][0] == 6.0
+    assert [row[1] for row in csv] == list(csv.column(1))
+    try:
+        csv.read(BytesIO(s), withhead=1, strip=True, convert=lambda v:int(v) * 10, columnar=True)
+        assert False
+    except ValueError:
+        pass
+
+    csv.read(BytesIO(s), withhead=1, strip=True, dtypes={'a':float, 'k':float}, columnar=True)
+    grouped = csv.groupby('a').agg({'b':['count', 'distinct', 'max'], 'k':['sum', 'mean']})
+    assert grouped.head == ['a', 'b_count', 'b_distinct', 'b_max', 'k_sum', 'k_mean']
+    assert list(grouped) == [[0.0, 2, 1, '9', 2.0, 1.0], [1.0, 3, 1, '2', 0.0, 0.0], [6.0, 1, 1, '6', 6.0, 6.0]]
+    streamed = GroupBy(CSVChunks(BytesIO(s), withhead=1, strip=True, dtypes={'a':float, 'k':float},
+                                 chunksize=2), ['a']).agg({'b':['count', 'distinct', 'max'], 'k':['sum', 'mean']})
+    assert [list(r) for r in streamed] == [list(r) for r in grouped]
+
+    csv.read(BytesIO(s), withhead=1, strip=True, convert=int, usecols=['c', 1],
+             predicate=lambda f:f[1] != b'9')
+    assert csv.head == ['c', 'b'] and csv.body == [[3, 2], [3, 2], [3, 2], [6, 6]]
+    q = b'id,"name, full",note\n1,"Smith, J","say ""hi""\non two lines"\n2,plain,5" x\n'
+    csv.read(BytesIO(q), withhead=1, strip=True, quoted=True)
+    assert csv.head == ['id', 'name, full', 'note']
+    assert csv.body == [['1', 'Smith, J', 'say "hi"\non two lines'], ['2', 'plain', '5" x']]
+    assert [list(c) for c in CSVChunks(BytesIO(q), withhead=1, quoted=True, chunksize=1)][0][2] == \
+           ['say "hi"\non two lines']
+    csv.read(BytesIO(s), withhead=1, strip=True, dtypes=int, usecols=[9], columnar=True,
+             predicate=lambda f:f[0] == b'0', chunksize=2)
+    assert csv.head == ['k'] and csv.shape == (3, 1)
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fn = os.path.join(tmpdir, 'a.csv')
+        with open(fn, 'wb') as f:
+            f.write(s)
+        for dtypes in (int, {'a':float}):
+            first, second = CSV(), CSV()
+            first.read(fn, withhead=1, strip=True, dtypes=dtypes, cache=True)
+            second.read(fn, withhead=1, strip=True, dtypes=dtypes, cache=True)
+            assert isinstance(second.column(0), numpy.memmap) and second.head == first.head
+            assert (second.to_array() == first.to_array()).all()
+        fn2 = os.path.join(tmpdir, 'a2.csv')
+        with open(fn2, 'wb') as f:
+            f.write(s.replace(b' 1,2,3', b' 7,2,3'))
+        cachedir = os.path.join(tmpdir, 'shared')
+        for rnd in range(2):
+            for each in (fn, fn2):
+                shared = CSV()
+                shared.read(each, withhead=1, strip=True, dtypes=int, cache=cachedir)
+                assert isinstance(shared.column(0), numpy.memmap) == bool(rnd)
+        assert len(os.listdir(cachedir)) == 2 and shared.column(0)[0] != first.column(0)[0]
+
+        third = CSV()
+        third.read(fn, withhead=1, strip=True, dtypes={'a':float}, nproc=2)
+        assert len(split_ranges(fn, 2)) == 2 and third.head == first.head
+        data = b'1,a\n\n2,b\n3,c\n4,d'
+        blocks = list(_range_lines(BytesIO(data), 4, len(data), 2, blocksize=3))
+        assert blocks == [[b'2,b', b'3,c'], [b'4,d']]
+        assert (third.to_array() == first.to_array()).all()
+        bad = os.path.join(tmpdir, 'bad.csv')
+        with open(bad, 'wb') as f:
+            f.write(b'a,b\n' + b''.join(b'%d,%d\n' % (i, i) for i in range(1000)) + b'x,1\n')
+        shmdir = '/dev/shm'
+        blocks = lambda: set(os.listdir(shmdir)) if os.path.isdir(shmdir) else set()
+        before = blocks()
+        try:
+            read_columns_parallel(bad, withhead=1, dtypes=int, chunksize=100, nproc=4)
+            assert False
+        except ValueError:
+            pass
+        assert blocks() <= before
+
+        path = os.path.join(tmpdir, 'table.biv')
+        CSV(['n', 's'], [[1, 'héllo'], [2, ''], [3, 'x,y']]).save_binary(path)
+        opened = CSV.open_binary(path)
+        assert isinstance(opened.column('s'), StringColumn) and opened.column('s')[2] == 'x,y'
+        assert opened.column('s').dtype.kind == 'U'
+        assert list(opened) == [[1, 'héllo'], [2, ''], [3, 'x,y']]
+        second.save_binary(path)
+        assert list(CSV.open_binary(path)) == list(second)
+        CSV(['s', 't'], numpy.array([['ab', 'c'], ['', 'def']])).save_binary(path)
+        opened = CSV.open_binary(path)
+        assert isinstance(opened.column('t'), StringColumn) and list(opened) == [['ab', 'c'], ['', 'def']]
+        CSV(['n', 's'], numpy.array([[1, 'x'], [2, 'y']], dtype=object)).save_binary(path)
+        assert list(CSV.open_binary(path).column('s')) == ['x', 'y']
+
+        counter = {'a':3, 'b':1, b'c':5, 'd':3, 'e':0}
+        out = os.path.join(tmpdir, 'c.csv')
+        assert save_counter_as_csv(counter, out, ['n', 'k'], runsize=2, batch=2) == 5
+        with open(out, 'rb') as f:
+            assert f.read() == BOM_UTF8 + b'n,k\n5,c\n3,a\n3,d\n1,b\n0,e\n'
+        assert save_counter_as_csv(counter, out, topn=2) == 2
+
+        out = os.path.join(tmpdir, 'b.csv')
+        assert second.write(out, chunksize=4) == 7
+        third = CSV()
+        third.read(out, withhead=1, strip=True, dtypes={'a':float}, columnar=True)
+        assert third.head == second.head and list(third.column('b')) == list(second.column('b'))
+        assert write_csv(out, ';', ((i, i * i) for i in range(5)), [], chunksize=2) == 5
+        with open(out, 'rb') as f:
+            assert f.read() == BOM_UTF8 + b'0;0\n1;1\n2;4\n3;9\n4;16\n'
+
     m = numpy.array([['a', 'b', 'c'],
                      ['b', 'c', 'd'],
                      ['d', 'e', 'f'],
@@ -317,6 +1735,23 @@ def test():
     print()
     print(indexed_all(m))
     print()
+    assert indexed(['b', 'a', 'b'], 1) == {'a':1, 'b':2}
+    assert indexed([(1, 2), (3, 4), (1, 2)], 1) == {(1, 2):1, (3, 4):2}
+    assert [type(k) for k in indexed([2, 1.5], 0)] == [float, int]
+
+    enc = CategoricalEncoder()
+    enc.fit_table(m[:3])
+    codes = enc.transform_table(m)
+    assert codes[0].tolist() == [1, 1, 1] and codes[3].tolist() == [1, -1, 1]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        enc.save(os.path.join(tmpdir, 'enc.npz'))
+        enc2 = CategoricalEncoder.load(os.path.join(tmpdir, 'enc.npz'))
+        assert (enc2.transform_table(m) == codes).all()
+
+    mcsv = CSV()
+    mcsv.read(BytesIO(b'\n'.join(b','.join(r) for r in m.astype(bytes).tolist())), columnar=True)
+    assert (indexed_by_column(mcsv) == indexed_by_column(m)).all()
+    assert (indexed_all(mcsv) == indexed_all(m)).all()
 
 
 if __name__ == '__main__':
@@ -4,10 +4,16 @@
 import sys
 import random
 import array
-from collections import MutableSet
+from collections.abc import MutableSet, Iterable
 from _collections import defaultdict
 from _operator import itemgetter
 import heapq
+from itertools import chain, count, filterfalse, repeat
+from bisect import bisect_left, bisect_right, insort
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def is_iterable(obj):
@@ -17,19 +23,110 @@ def is_iterable(obj):
     return hasattr(obj, '__iter__') and not isinstance(obj, str) and not isinstance(obj, tuple)
 
 
+# placeholder of removed items in OrderedSet storage
+_REMOVED = object()
+
+
 class OrderedSet(MutableSet):
     """
     An OrderedSet is a custom MutableSet that remembers its order, 
     so that every entry has an index that can be looked up.
+    Removed items leave a placeholder behind, so removal is O(1), the
+    storage is compacted when it is more than half placeholders or before
+    iteration and slicing, while placeholders exist positions of single
+    items are found by a Fenwick tree of live slots in O(log n).
     """
     def __init__(self, iterable=None):
-        self.items = []
-        self.map = {}
+        self._items = []
+        self._map = {}
+        self._holes = 0
+        self._head = 0
+        self._tree = None
         if iterable is not None:
-            self |= iterable
+            self.update(iterable)
+
+    @classmethod
+    def _from_unique(cls, items):
+        """ Make an OrderedSet taking list `items` of unique keys as its storage. """
+        result = cls()
+        result._items = items
+        result._map = dict(zip(items, range(len(items))))
+        return result
+
+    @staticmethod
+    def _as_container(other):
+        """ Get `other` as something with fast `in`. """
+        if isinstance(other, (set, frozenset, dict, OrderedSet)):
+            return other
+        return set(other)
+
+    @property
+    def items(self):
+        self._compact()
+        return self._items
+
+    @property
+    def map(self):
+        self._compact()
+        return self._map
+
+    def _compact(self):
+        """ Drop placeholders and renumber items. """
+        if self._holes:
+            items = [x for x in self._items if x is not _REMOVED]
+            self._items = items
+            self._map = dict(zip(items, range(len(items))))
+            self._holes = self._head = 0
+            self._tree = None
+
+    def _assign(self, other):
+        """ Take the storage of OrderedSet `other`. """
+        self._items, self._map, self._holes, self._head = other._items, other._map, 0, 0
+        self._tree = None
+
+    def _sync(self):
+        """ Build the Fenwick tree(1-based) of live slots, or extend it over appended slots. """
+        items, tree = self._items, self._tree
+        if tree is None:
+            tree = self._tree = [0]
+            tree.extend(0 if x is _REMOVED else 1 for x in items)
+            size = len(tree)
+            for k in range(1, size):
+                parent = k + (k & -k)
+                if parent < size:
+                    tree[parent] += tree[k]
+            return tree
+        for k in range(len(tree), len(items) + 1):
+            total = 0 if items[k - 1] is _REMOVED else 1
+            j, low = k - 1, k - (k & -k)
+            while j > low:
+                total += tree[j]
+                j &= j - 1
+            tree.append(total)
+        return tree
+
+    def _rank(self, slot):
+        """ Number of live items stored before `slot`. """
+        tree, total = self._sync(), 0
+        while slot:
+            total += tree[slot]
+            slot &= slot - 1
+        return total
+
+    def _select(self, index):
+        """ Slot of the live item at position `index`. """
+        tree = self._sync()
+        slot, step = 0, 1 << (len(tree) - 1).bit_length()
+        while step:
+            nxt = slot + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                index -= tree[nxt]
+                slot = nxt
+            step >>= 1
+        return slot
 
     def __len__(self):
-        return len(self.items)
+        return len(self._items) - self._holes
 
     def __getitem__(self, index):
         """
@@ -41,16 +138,24 @@ class OrderedSet(MutableSet):
         corresponding to those indices. This is similar to NumPy's
         "fancy indexing".
         """
+        if hasattr(index, '__index__'):
+            size, i = len(self), index.__index__()
+            if i < 0:
+                i += size
+            if not 0 <= i < size:
+                raise IndexError('OrderedSet index out of range')
+            return self._items[self._select(i) if self._holes else i]
+        self._compact()
         if index == slice(None):
             return self
-        elif hasattr(index, '__index__') or isinstance(index, slice):
-            result = self.items[index]
+        elif isinstance(index, slice):
+            result = self._items[index]
             if isinstance(result, list):
-                return OrderedSet(result)
+                return OrderedSet._from_unique(result)
             else:
                 return result
         elif is_iterable(index):
-            return OrderedSet([self.items[i] for i in index])
+            return OrderedSet([self._items[i] for i in index])
         else:
             raise TypeError("Don't know how to index an OrderedSet by %r" %
                     index)
@@ -76,7 +181,7 @@ class OrderedSet(MutableSet):
             self.__init__(state)
 
     def __contains__(self, key):
-        return key in self.map
+        return key in self._map
 
     def add(self, key):
         """
@@ -84,10 +189,11 @@ class OrderedSet(MutableSet):
         If `key` is already in the OrderedSet, return the index it already
         had.
         """
-        if key not in self.map:
-            self.map[key] = len(self.items)
-            self.items.append(key)
-        return self.map[key]
+        if key not in self._map:
+            self._map[key] = len(self._items)
+            self._items.append(key)
+            return len(self._items) - 1 - self._holes
+        return self.index(key)
     append = add
 
     def update(self, sequence):
@@ -95,13 +201,102 @@ class OrderedSet(MutableSet):
         Update the set with the given iterable sequence, then return the index
         of the last element inserted.
         """
-        item_index = None
+        items, known = self._items, self._map
         try:
-            for item in sequence:
-                item_index = self.add(item)
+            if not isinstance(sequence, (list, tuple)):
+                sequence = list(sequence)
+            size = len(known)
+            if known:
+                new = list(filterfalse(known.__contains__, sequence))
+                known.update(zip(new, count(len(items))))
+            else:
+                new = list(sequence)
+                known = self._map = dict(zip(new, count(len(items))))
         except TypeError:
             raise ValueError('Argument needs to be an iterable, got %s' % type(sequence))
-        return item_index
+        if len(known) - size != len(new):
+            # duplicates in `sequence`, number the first occurrences again
+            new = list(dict.fromkeys(new))
+            known.update(zip(new, count(len(items))))
+        items.extend(new)
+        return self.index(sequence[-1]) if sequence else None
+
+    def union(self, *others):
+        """ Return a new OrderedSet of items in this set or any of `others`. """
+        result = OrderedSet._from_unique(list(self))
+        for other in others:
+            result.update(other)
+        return result
+
+    def intersection(self, *others):
+        """ Return a new OrderedSet of items in this set and all of `others`, in this order. """
+        items = list(self)
+        for other in others:
+            other = self._as_container(other)
+            items = [k for k in items if k in other]
+        return OrderedSet._from_unique(items)
+
+    def difference(self, *others):
+        """ Return a new OrderedSet of items in this set but not in any of `others`. """
+        items = list(self)
+        for other in others:
+            other = self._as_container(other)
+            items = [k for k in items if k not in other]
+        return OrderedSet._from_unique(items)
+
+    def symmetric_difference(self, other):
+        """ Return a new OrderedSet of items in exactly one of the sets, items of this set first. """
+        other = other if isinstance(other, OrderedSet) else OrderedSet(other)
+        result = self.difference(other)
+        result.update([k for k in other if k not in self._map])
+        return result
+
+    def intersection_update(self, *others):
+        """ Keep only items also in all of `others`. """
+        result = self.intersection(*others)
+        self._assign(result)
+
+    def difference_update(self, *others):
+        """ Remove all items in any of `others`. """
+        result = self.difference(*others)
+        self._assign(result)
+
+    def _bulk(self, other, method):
+        if not isinstance(other, Iterable):
+            return NotImplemented
+        return method(self, other)
+
+    def __or__(self, other):
+        return self._bulk(other, OrderedSet.union)
+
+    def __and__(self, other):
+        return self._bulk(other, OrderedSet.intersection)
+
+    def __sub__(self, other):
+        return self._bulk(other, OrderedSet.difference)
+
+    def __xor__(self, other):
+        return self._bulk(other, OrderedSet.symmetric_difference)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        if other is self:
+            self.clear()
+        else:
+            self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        result = self.symmetric_difference(other)
+        self._assign(result)
+        return self
 
     def index(self, key):
         """
@@ -112,19 +307,31 @@ class OrderedSet(MutableSet):
         """
         if is_iterable(key):
             return [self.index(subkey) for subkey in key]
-        return self.map[key]
+        slot = self._map[key]
+        return self._rank(slot) if self._holes else slot
 
-    def pop(self):
+    def pop(self, index=-1):
         """
-        Remove and return the last element from the set.
+        Remove and return the element at `index`(default the last) from the set.
+        Popping the first or the last element is O(1), other positions are
+        found in O(log n).
         Raises KeyError if the set is empty.
         """
-        if not self.items:
+        size = len(self)
+        if not size:
             raise KeyError('Set is empty')
-
-        elem = self.items[-1]
-        del self.items[-1]
-        del self.map[elem]
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('OrderedSet index out of range')
+
+        if index == size - 1:
+            elem = self._items[-1]
+        elif index == 0:
+            elem = self._items[self._head]
+        else:
+            elem = self._items[self._select(index) if self._holes else index]
+        self.discard(elem)
         return elem
 
     def discard(self, key):
@@ -133,24 +340,49 @@ class OrderedSet(MutableSet):
         The MutableSet mixin uses this to implement the .remove() method, which
         *does* raise an error when asked to remove a non-existent item.
         """
-        if key in self:
-            i = self.map[key]
-            del self.items[i]
-            del self.map[key]
-            for k, v in self.map.items():
-                if v >= i:
-                    self.map[k] = v - 1
+        i = self._map.pop(key, _REMOVED)
+        if i is _REMOVED:
+            return
+        items, tree = self._items, self._tree
+        if i == len(items) - 1:
+            items.pop()
+            while items and items[-1] is _REMOVED:
+                items.pop()
+                self._holes -= 1
+            if tree is not None:
+                # nodes of a Fenwick tree never cover slots after them
+                del tree[len(items) + 1:]
+        else:
+            items[i] = _REMOVED
+            self._holes += 1
+            if i == self._head:
+                while items[self._head] is _REMOVED:
+                    self._head += 1
+            if tree is not None:
+                k = i + 1
+                while k < len(tree):
+                    tree[k] -= 1
+                    k += k & -k
+        if not items:
+            self._holes = self._head = 0
+            self._tree = None
+        elif self._holes > 16 and self._holes * 2 > len(items):
+            self._compact()
 
     def clear(self):
         """ Remove all items from this OrderedSet. """
-        del self.items[:]
-        self.map.clear()
+        del self._items[:]
+        self._map.clear()
+        self._holes = self._head = 0
+        self._tree = None
 
     def __iter__(self):
-        return iter(self.items)
+        self._compact()
+        return iter(self._items)
 
     def __reversed__(self):
-        return reversed(self.items)
+        self._compact()
+        return reversed(self._items)
 
     def __repr__(self):
         if not self:
@@ -273,18 +505,10 @@ class BisectList(list):
         return grouper
 
     def bsearch(self, x) -> int:
-        lo = 0
-        hi = self.__len__()
-
-        while lo < hi:
-            mid = (lo + hi) >> 1
-            if self[mid] < x:
-                lo = mid + 1
-            else:
-                if self[mid] == x:
-                    return mid
-                hi = mid
-            return -1
+        i = bisect_left(self, x)
+        if i != len(self) and self[i] == x:
+            return i
+        return -1
 
     def bisect(self, x, lo=0, hi=None, right=False) -> int:
         if lo < 0:
@@ -294,27 +518,299 @@ class BisectList(list):
             hi = self.__len__()
 
         if right:
-            while lo < hi:
-                mid = (lo + hi) >> 1
-                if self[mid] > x:
-                    hi = mid
-                else:
-                    lo = mid + 1
-        else:
-            while lo < hi:
-                mid = (lo + hi) >> 1
-                if self[mid] < x:
-                    lo = mid + 1
-                else:
-                    hi = mid
-
-        return lo
+            return bisect_right(self, x, lo, hi)
+        return bisect_left(self, x, lo, hi)
 
     def insort(self, x, lo=0, hi=None, right=False) -> int:
         pos = self.bisect(x, lo, hi, right)
         self.insert(pos, x)
         return pos
 
+    def insort_many(self, iterable) -> int:
+        ''' Insert a batch of values keeping the list sorted, equal values go after existing ones,
+            the sorted batch is appended and merged with one timsort pass over the two runs '''
+        values = sorted(iterable)
+        if len(values) <= 8:
+            for x in values:
+                insort(self, x)
+        elif not self or not values[0] < self[-1]:
+            self.extend(values)
+        else:
+            self.extend(values)
+            self.sort()
+        return len(values)
+
+
+class SortedList(object):
+    ''' Sorted list kept as a list of sorted blocks(about `load` items each) with their maxes,
+        a Fenwick tree of block lengths is the positional index, so add, remove, bisect and
+        indexing are O(log n) besides a short memmove in one block, eg:
+            sl = SortedList([5, 1, 3])
+            sl.add(2); sl.remove(5)
+            sl[0], sl.bisect_left(3), list(sl.irange(2, 4))
+    '''
+    __slots__ = ('_lists', '_maxes', '_index', '_len', '_load')
+
+    def __init__(self, iterable=None, load=1000):
+        if load < 4:
+            raise ValueError('load must be at least 4')
+        self._load = load
+        self.clear()
+        if iterable is not None:
+            self.update(iterable)
+
+    def clear(self):
+        self._lists = []
+        self._maxes = []
+        self._index = None
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self))
+
+    def __iter__(self):
+        return chain.from_iterable(self._lists)
+
+    def __reversed__(self):
+        return chain.from_iterable(map(reversed, reversed(self._lists)))
+
+    def __contains__(self, value):
+        maxes = self._maxes
+        pos = bisect_left(maxes, value)
+        if pos == len(maxes):
+            return False
+        block = self._lists[pos]
+        return block[bisect_left(block, value)] == value
+
+    def _reindex(self):
+        ''' Build the Fenwick tree(1-based, tree[0] unused) over block lengths '''
+        tree = [0] + [len(block) for block in self._lists]
+        size = len(tree)
+        for k in range(1, size):
+            parent = k + (k & -k)
+            if parent < size:
+                tree[parent] += tree[k]
+        self._index = tree
+
+    def _grow(self, pos, delta):
+        tree = self._index
+        if tree is None:
+            return
+        k, size = pos + 1, len(tree)
+        while k < size:
+            tree[k] += delta
+            k += k & -k
+
+    def _offset(self, pos) -> int:
+        ''' Number of items in blocks before block `pos` '''
+        if self._index is None:
+            self._reindex()
+        tree, total = self._index, 0
+        while pos:
+            total += tree[pos]
+            pos &= pos - 1
+        return total
+
+    def _locate(self, index) -> (int, int):
+        ''' Map a non-negative position to (block, position in block) '''
+        if self._index is None:
+            self._reindex()
+        tree = self._index
+        pos, step = 0, 1 << (len(tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                index -= tree[nxt]
+                pos = nxt
+            step >>= 1
+        return pos, index
+
+    def _normalize(self, index) -> int:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('SortedList index out of range')
+        return index
+
+    def add(self, value):
+        ''' Insert `value`, equal values are kept after the existing ones '''
+        lists, maxes = self._lists, self._maxes
+        if not maxes:
+            lists.append([value])
+            maxes.append(value)
+            self._index = None
+            self._len = 1
+            return
+        pos = bisect_right(maxes, value)
+        if pos == len(maxes):
+            pos -= 1
+            lists[pos].append(value)
+            maxes[pos] = value
+        else:
+            insort(lists[pos], value)
+        self._len += 1
+        self._grow(pos, 1)
+        if len(lists[pos]) > 2 * self._load:
+            self._split(pos)
+
+    def _split(self, pos):
+        block = self._lists[pos]
+        half = len(block) >> 1
+        self._lists[pos:pos + 1] = [block[:half], block[half:]]
+        self._maxes[pos:pos + 1] = [block[half - 1], block[-1]]
+        self._index = None
+
+    def update(self, iterable):
+        ''' Add all values, a batch as large as the list itself is merged by one sort '''
+        values = sorted(iterable)
+        if not values:
+            return
+        if len(values) * 8 < self._len:
+            for value in values:
+                self.add(value)
+            return
+        if self._lists:
+            values = list(chain(chain.from_iterable(self._lists), values))
+            values.sort()
+        load = self._load
+        self._lists = [values[i:i + load] for i in range(0, len(values), load)]
+        self._maxes = [block[-1] for block in self._lists]
+        self._len = len(values)
+        self._index = None
+
+    def _delete(self, pos, idx):
+        lists, maxes = self._lists, self._maxes
+        block = lists[pos]
+        del block[idx]
+        self._len -= 1
+        if not block:
+            del lists[pos]
+            del maxes[pos]
+            self._index = None
+            return
+        maxes[pos] = block[-1]
+        self._grow(pos, -1)
+        if len(block) < self._load >> 1 and len(lists) > 1:
+            # merge a small block into a neighbour, split again if too large
+            left = pos - 1 if pos else pos
+            lists[left:left + 2] = [lists[left] + lists[left + 1]]
+            maxes[left:left + 2] = [maxes[left + 1]]
+            self._index = None
+            if len(lists[left]) > 2 * self._load:
+                self._split(left)
+
+    def discard(self, value):
+        ''' Remove one `value` if present '''
+        maxes = self._maxes
+        pos = bisect_left(maxes, value)
+        if pos == len(maxes):
+            return False
+        block = self._lists[pos]
+        idx = bisect_left(block, value)
+        if block[idx] != value:
+            return False
+        self._delete(pos, idx)
+        return True
+
+    def remove(self, value):
+        ''' Remove one `value`, raise ValueError if absent '''
+        if not self.discard(value):
+            raise ValueError('%r not in list' % (value,))
+
+    def pop(self, index=-1):
+        ''' Remove and return the value at `index`(default the largest) '''
+        if index == -1 and self._len:
+            pos = len(self._lists) - 1
+            idx = len(self._lists[pos]) - 1
+        else:
+            pos, idx = self._locate(self._normalize(index))
+        value = self._lists[pos][idx]
+        self._delete(pos, idx)
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step == 1:
+                return list(self.islice(start, stop))
+            return list(self)[index]
+        if index == 0 and self._len:
+            return self._lists[0][0]
+        if index == -1 and self._len:
+            return self._lists[-1][-1]
+        pos, idx = self._locate(self._normalize(index))
+        return self._lists[pos][idx]
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            values = self[index]
+            for value in values:
+                self.remove(value)
+            return
+        self._delete(*self._locate(self._normalize(index)))
+
+    def bisect_left(self, value) -> int:
+        ''' Index to insert `value` before equal ones '''
+        maxes = self._maxes
+        pos = bisect_left(maxes, value)
+        if pos == len(maxes):
+            return self._len
+        return self._offset(pos) + bisect_left(self._lists[pos], value)
+
+    def bisect_right(self, value) -> int:
+        ''' Index to insert `value` after equal ones '''
+        maxes = self._maxes
+        pos = bisect_right(maxes, value)
+        if pos == len(maxes):
+            return self._len
+        return self._offset(pos) + bisect_right(self._lists[pos], value)
+    bisect = bisect_right
+
+    def count(self, value) -> int:
+        return self.bisect_right(value) - self.bisect_left(value)
+
+    def index(self, value) -> int:
+        ''' Index of the first `value`, raise ValueError if absent '''
+        i = self.bisect_left(value)
+        if i == self._len or self[i] != value:
+            raise ValueError('%r not in list' % (value,))
+        return i
+
+    def islice(self, start=None, stop=None, reverse=False):
+        ''' Iterate values at positions in [start, stop) '''
+        start, stop, _ = slice(start, stop).indices(self._len)
+        if start >= stop:
+            return iter(())
+        pos, idx = self._locate(start)
+        end, endidx = self._locate(stop - 1)
+        lists = self._lists
+        if pos == end:
+            parts = [lists[pos][idx:endidx + 1]]
+        else:
+            parts = [lists[pos][idx:]] + lists[pos + 1:end] + [lists[end][:endidx + 1]]
+        if reverse:
+            return chain.from_iterable(map(reversed, reversed(parts)))
+        return chain.from_iterable(parts)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True), reverse=False):
+        ''' Iterate values between `minimum` and `maximum`(None for unbounded) '''
+        if minimum is None:
+            start = 0
+        else:
+            start = self.bisect_left(minimum) if inclusive[0] else self.bisect_right(minimum)
+        if maximum is None:
+            stop = self._len
+        else:
+            stop = self.bisect_right(maximum) if inclusive[1] else self.bisect_left(maximum)
+        return self.islice(start, stop, reverse)
+
+    def count_range(self, minimum, maximum) -> int:
+        ''' Number of values in [minimum, maximum] '''
+        return max(self.bisect_right(maximum) - self.bisect_left(minimum), 0)
+
 
 class CounterType(defaultdict):
     ''' A counter type for statistics and remove duplicates '''
@@ -393,6 +889,154 @@ def most_common(d:dict, topn=10) -> list:
     return heapq.nlargest(topn, d.items(), key=itemgetter(1))
 
 
+class ArrayCounter(object):
+    ''' Counter of dense non-negative integer keys(ids, hash buckets...) kept in one int64 array,
+        numpy.ndarray if numpy is available else array('q'), grows on demand, eg:
+            c = ArrayCounter()
+            c[3] += 1; c.add_many([1, 2, 2, 7])
+            c.most_common(2) -> [(2, 2), (1, 1)]
+    '''
+    __slots__ = ('_counts',)
+
+    def __init__(self, keys=None, size=1024):
+        self._counts = self._zeros(max(size, 1))
+        if keys is not None:
+            self.add_many(keys)
+
+    @staticmethod
+    def _zeros(n):
+        if numpy is not None:
+            return numpy.zeros(n, dtype=numpy.int64)
+        return array.array('q', bytes(8 * n))
+
+    def _grow(self, key):
+        counts = self._counts
+        size = max(key + 1, len(counts) << 1)
+        if numpy is not None:
+            grown = numpy.zeros(size, dtype=numpy.int64)
+            grown[:len(counts)] = counts
+        else:
+            grown = counts + array.array('q', bytes(8 * (size - len(counts))))
+        self._counts = grown
+
+    @staticmethod
+    def _check(key):
+        if key < 0:
+            raise KeyError(key)
+        return key
+
+    def __getitem__(self, key) -> int:
+        if self._check(key) >= len(self._counts):
+            return 0
+        return int(self._counts[key])
+
+    def __setitem__(self, key, value):
+        if self._check(key) >= len(self._counts):
+            self._grow(key)
+        self._counts[key] = value
+
+    def __delitem__(self, key):
+        if self[key]:
+            self._counts[key] = 0
+
+    def __contains__(self, key) -> bool:
+        return 0 <= key < len(self._counts) and self._counts[key] != 0
+
+    def __len__(self) -> int:
+        ''' Number of keys with non-zero count '''
+        if numpy is not None:
+            return int(numpy.count_nonzero(self._counts))
+        return len(self._counts) - self._counts.count(0)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._counts) * self._counts.itemsize
+
+    def add(self, key, n=1):
+        if self._check(key) >= len(self._counts):
+            self._grow(key)
+        self._counts[key] += n
+
+    def add_many(self, keys, weights=None):
+        ''' Count all `keys` at once, each one by 1 or by the matching `weights` '''
+        if numpy is None:
+            keys = list(keys)
+            if keys and min(keys) < 0:
+                raise KeyError(min(keys))
+            for key, n in zip(keys, repeat(1) if weights is None else weights):
+                self.add(key, n)
+            return
+        keys = numpy.asarray(keys if hasattr(keys, '__len__') else list(keys), dtype=numpy.int64)
+        if not keys.size:
+            return
+        if keys.min() < 0:
+            raise KeyError(int(keys.min()))
+        top = int(keys.max())
+        if top >= len(self._counts):
+            self._grow(top)
+        counts = self._counts
+        if weights is not None:
+            numpy.add.at(counts, keys, numpy.asarray(weights, dtype=numpy.int64))
+        elif keys.size * 8 < top:
+            # few keys over a wide range, bincount would allocate the whole span
+            numpy.add.at(counts, keys, 1)
+        else:
+            binned = numpy.bincount(keys)
+            counts[:len(binned)] += binned
+
+    def update(self, other):
+        ''' Add counts from a mapping or another ArrayCounter '''
+        if isinstance(other, ArrayCounter):
+            if len(other._counts) > len(self._counts):
+                self._grow(len(other._counts) - 1)
+            if numpy is not None:
+                self._counts[:len(other._counts)] += other._counts
+                return
+        for key, n in other.items():
+            self.add(key, n)
+
+    def keys(self) -> list:
+        if numpy is not None:
+            return numpy.flatnonzero(self._counts).tolist()
+        return [k for k, n in enumerate(self._counts) if n]
+
+    def values(self) -> list:
+        if numpy is not None:
+            return self._counts[self._counts != 0].tolist()
+        return [n for n in self._counts if n]
+
+    def items(self) -> list:
+        return list(zip(self.keys(), self.values()))
+
+    def total(self) -> int:
+        if numpy is not None:
+            return int(self._counts.sum())
+        return sum(self._counts)
+
+    def most_common(self, topn=10) -> list:
+        ''' List (key, count) of the `topn` largest counts, all if `topn` is None or 0 '''
+        if numpy is None:
+            return most_common(dict(self.items()), topn)
+        counts = self._counts
+        if not topn or topn >= len(counts):
+            keys = numpy.flatnonzero(counts)
+            keys = keys[numpy.argsort(-counts[keys], kind='stable')]
+        else:
+            keys = numpy.argpartition(-counts, topn - 1)[:topn]
+            keys = keys[numpy.lexsort((keys, -counts[keys]))]
+            keys = keys[counts[keys] != 0]
+        return list(zip(keys.tolist(), counts[keys].tolist()))
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+
 import unittest
 class TestIteralgos(unittest.TestCase):
     ''' Unit tester for iteralgos '''
@@ -422,9 +1066,41 @@ class TestIteralgos(unittest.TestCase):
         s.pop()
         s.pop()
         self.assertEqual(s.__len__(), 16, len(s))
+        self.assertEqual(s.pop(0), 19)
+        s.discard(10)
+        self.assertEqual((s[8], s.index(9), len(s)), (9, 8, 14))
+        for i in list(s):
+            s.discard(i)
+        self.assertEqual(len(s), 0)
+        self.assertEqual(s.update([3, 1, 3, 2]), 2)
+        t = OrderedSet([2, 5, 3])
+        self.assertEqual(list(s | t), [3, 1, 2, 5])
+        self.assertEqual(list(s & t), [3, 2])
+        self.assertEqual(list(s - t), [1])
+        self.assertEqual(list(s ^ t), [1, 5])
+        self.assertEqual((s[1:].index(2), s[1:][0]), (1, 1))
+        s -= [3]
+        self.assertEqual((list(s), s.index(2)), ([1, 2], 1))
         s.clear()
         self.assertEqual(s, OrderedSet([]))
         self.assertEqual(len(s), 0)
+        s = OrderedSet(range(100))
+        s.discard(50)
+        self.assertEqual((s.update([100]), s.add(99), s.index(51), s[50]), (99, 98, 50, 51))
+        self.assertEqual(s._holes, 1)
+        self.assertEqual((s.pop(60), s.pop(-3), s._holes), (61, 98, 3))
+        model = [i for i in range(101) if i not in (50, 61, 98)]
+        for step in range(300):
+            key = random.choice(model)
+            model.remove(key)
+            s.discard(key)
+            s.add(1000 + step)
+            model.append(1000 + step)
+            i = random.randrange(len(model))
+            self.assertEqual((s[i], s.index(model[i])), (model[i], i))
+            if step % 7 == 0:
+                self.assertEqual(s.pop(i), model.pop(i))
+        self.assertEqual(list(s), model)
     
     def test_BiMap(self):
         d = [('name1', 'Mike'), ('name2', 'Jerry'), ('tag', 2.4), ('base', (1, 2, 3))]
@@ -455,8 +1131,10 @@ class TestIteralgos(unittest.TestCase):
             sl.append(random.randint(1, 100000))
         sl.sort()
 
-        for i in range(100000, 200000):
+        for i in range(100001, 200000):
             assert sl.bsearch(i) == -1
+        for i in sl[::1000]:
+            assert sl[sl.bsearch(i)] == i
         for i in range(10000):
             sl.insort(i)
             sl.insort(i, right=True)
@@ -467,6 +1145,15 @@ class TestIteralgos(unittest.TestCase):
         for i in range(100000):
             self.assertEqual(tmp[i], sl[i])
 
+        batch = [random.randint(1, 100000) for _ in range(5000)]
+        tmp.extend(batch)
+        tmp.sort()
+        self.assertEqual(sl.insort_many(iter(batch)), 5000)
+        self.assertEqual(sl.insort_many(batch[:3]), 3)
+        tmp.extend(batch[:3])
+        tmp.sort()
+        self.assertEqual(sl, tmp)
+
         s = sl.make_set()
         d = sl.make_dict(False)
         self.assertTrue(len(s) <= len(d))
@@ -474,6 +1161,39 @@ class TestIteralgos(unittest.TestCase):
         self.assertTrue(len(s) == len(d))
         self.assertTrue(len(d) <= len(sl))
 
+    def test_SortedList(self):
+        data = [random.randint(1, 5000) for _ in range(20000)]
+        sl = SortedList(data[:10000], load=16)
+        for x in data[10000:]:
+            sl.add(x)
+        data.sort()
+        self.assertEqual(list(sl), data)
+        self.assertEqual(list(reversed(sl)), data[::-1])
+        for i in range(0, 20000, 37):
+            self.assertEqual(sl[i], data[i])
+            self.assertEqual(sl.bisect_left(data[i]), bisect_left(data, data[i]))
+            self.assertEqual(sl.bisect_right(data[i]), bisect_right(data, data[i]))
+        self.assertEqual(sl[-1], data[-1])
+        self.assertEqual(sl[100:200], data[100:200])
+        self.assertEqual(list(sl.irange(100, 200)), [x for x in data if 100 <= x <= 200])
+        self.assertEqual(list(sl.irange(100, 200, (False, False), True)),
+                         [x for x in reversed(data) if 100 < x < 200])
+        self.assertEqual(sl.count_range(100, 200), len([x for x in data if 100 <= x <= 200]))
+        for x in data[::3]:
+            sl.remove(x)
+            data.remove(x)
+        self.assertEqual(list(sl), data)
+        self.assertEqual(len(sl), len(data))
+        self.assertEqual(sl.pop(), data.pop())
+        self.assertEqual(sl.pop(0), data.pop(0))
+        del sl[50]
+        del data[50]
+        self.assertEqual(sl[:], data)
+        self.assertEqual(sl.index(data[10]), data.index(data[10]))
+        self.assertRaises(ValueError, sl.remove, 0)
+        self.assertFalse(6000 in sl)
+        self.assertTrue(data[7] in sl)
+
     def test_Dict(self):
         d4 = make_nested_counter4(0)
         d4['go1']['in']['key0']['name1'] += 100
@@ -496,6 +1216,32 @@ class TestIteralgos(unittest.TestCase):
 
         self.assertTrue(most_common(d, 2) == [(4, 14), (3, 13)])
 
+    def test_ArrayCounter(self):
+        keys = [random.randint(0, 5000) for _ in range(20000)]
+        d = make_counter()
+        for k in keys:
+            d[k] += 1
+        c = ArrayCounter(size=16)
+        c.add_many(keys[:10000])
+        c.add_many(iter(keys[10000:]))
+        self.assertEqual(c.to_dict(), dict(d))
+        self.assertEqual(len(c), len(d))
+        self.assertEqual(c.total(), 20000)
+        top = c.most_common(5)
+        self.assertEqual([n for _, n in top], [n for _, n in most_common(d, 5)])
+        self.assertEqual(c.most_common(None), sorted(c.items(), key=itemgetter(1), reverse=True))
+        c[100000] += 3
+        c.add(7, 2)
+        c.add_many([7, 100000], [1, 1])
+        self.assertEqual(c[100000], 4)
+        self.assertEqual(c[7], d[7] + 3)
+        self.assertEqual(c[200000], 0)
+        del c[100000]
+        self.assertFalse(100000 in c)
+        self.assertRaises(KeyError, c.add_many, [1, -1])
+        c.update(ArrayCounter([1, 1]))
+        self.assertEqual(c[1], d[1] + 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# author : cypro666
+# note   : python3.4+
+'''
+Benchmarks for readers and splitters in magic3.linescan, run like:
+    python3 -m magic3.linebench -s 2048 -l 120 -n 10 -o result.json
+each benchmark runs in a fresh process, so the peak RSS reported is its own
+'''
+import os, sys, json, time, random, string, resource, tempfile
+from multiprocessing import Process, Pipe
+from magic3.linescan import LineParserBase, AWKLineParserBase, read_from_awk, file_count, FileSpliter
+from magic3.optparse import OptionParser
+
+MB = 1024 * 1024
+
+
+def make_log(filename, size, linelen=120, nfield=10, delim=' ', seed=0) -> int:
+    ''' Write about `size` bytes of synthetic log, each line has `nfield` fields joined by `delim`
+        and about `linelen` bytes, return number of lines written '''
+    rand = random.Random(seed)
+    chars = string.ascii_letters + string.digits
+    width = max((linelen - nfield + 1) // nfield, 1)
+
+    def make_line():
+        fields = (''.join(rand.choice(chars) for _ in range(rand.randint(1, 2 * width - 1)))
+                  for _ in range(nfield))
+        return (delim.join(fields) + '\n').encode()
+
+    pool = [make_line() for _ in range(4096)]
+    nline, written = 0, 0
+    with open(filename, 'wb') as fout:
+        while written < size:
+            block = rand.sample(pool, 1024)
+            data = b''.join(block)
+            fout.write(data)
+            written += len(data)
+            nline += len(block)
+    return nline
+
+
+class _CountParser(LineParserBase):
+    def __init__(self, filename, mode):
+        super().__init__(filenames=[filename])
+        self.mode = mode
+        self.count = 0
+
+    def parse_line(self, line):
+        self.count += 1
+
+    def run(self):
+        self.read_all(self.mode)
+
+
+class _AWKCountParser(AWKLineParserBase):
+    def __init__(self, filename):
+        super().__init__(filenames=[filename])
+        self.count = 0
+
+    def parse_line(self, seps):
+        self.count += 1
+
+
+def _bench_text(filename, delim):
+    parser = _CountParser(filename, 'r')
+    parser.run()
+    return parser.count
+
+def _bench_binary(filename, delim):
+    parser = _CountParser(filename, 'rb')
+    parser.run()
+    return parser.count
+
+def _bench_awk_parser(filename, delim):
+    parser = _AWKCountParser(filename)
+    parser.run([1, 2], delim)
+    return parser.count
+
+def _bench_read_from_awk(filename, delim):
+    return sum(1 for _ in read_from_awk([filename], [1, 2], delim))
+
+def _bench_file_count(filename, delim):
+    return file_count(filename)[0]
+
+def _bench_split(method, *args):
+    def _bench(filename, delim):
+        names = getattr(FileSpliter(filename), method)(*args)
+        for fn in names:
+            if os.path.exists(fn):
+                os.unlink(fn)
+        return len(names)
+    return _bench
+
+
+BENCHMARKS = {
+    'LineParserBase.text'       : _bench_text,
+    'LineParserBase.binary'     : _bench_binary,
+    'AWKLineParserBase'         : _bench_awk_parser,
+    'read_from_awk'             : _bench_read_from_awk,
+    'file_count'                : _bench_file_count,
+    'FileSpliter.split_by_lines': _bench_split('split_by_lines', 1000000),
+    'FileSpliter.split_by_size' : _bench_split('split_by_size', 256 * MB),
+    'FileSpliter.splitN'        : _bench_split('splitN', 4),
+}
+
+
+def _child(conn, name, filename, delim):
+    try:
+        t = time.perf_counter()
+        ret = BENCHMARKS[name](filename, delim)
+        seconds = time.perf_counter() - t
+        rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        conn.send({'seconds':seconds, 'result':ret, 'peak_rss_kb':rss})
+    except Exception as e:
+        conn.send({'error':'%s: %s' % (type(e).__name__, e)})
+    finally:
+        conn.close()
+
+
+def run_bench(name, filename, delim=' ') -> dict:
+    ''' Run one benchmark in a new process, return its seconds, MB/s and peak RSS '''
+    reader, writer = Pipe(False)
+    proc = Process(target=_child, args=(writer, name, filename, delim))
+    proc.start()
+    writer.close()
+    ret = reader.recv()
+    proc.join()
+    ret['name'] = name
+    if 'seconds' in ret:
+        ret['mb_per_sec'] = os.path.getsize(filename) / MB / ret['seconds'] if ret['seconds'] else 0.0
+    return ret
+
+
+def run_benches(filename, names=None, delim=' ') -> list:
+    ''' Run benchmarks in `names`(default all) over `filename` '''
+    results = []
+    for name in names if names else sorted(BENCHMARKS):
+        if name not in BENCHMARKS:
+            raise KeyError(name)
+        results.append(run_bench(name, filename, delim))
+    return results
+
+
+def bench(size=64, linelen=120, nfield=10, delim=' ', names=None, filename=None, keep=False) -> dict:
+    ''' Generate a `size` MB log if `filename` is not given, run benchmarks and return report '''
+    made = not filename
+    if made:
+        fd, filename = tempfile.mkstemp(prefix='linebench-', suffix='.log')
+        os.close(fd)
+        make_log(filename, size * MB, linelen, nfield, delim)
+    try:
+        report = {'file':filename,
+                  'size':os.path.getsize(filename),
+                  'linelen':linelen,
+                  'nfield':nfield,
+                  'delim':delim,
+                  'time':time.strftime('%F %T'),
+                  'results':run_benches(filename, names, delim)}
+    finally:
+        if made and not keep:
+            os.unlink(filename)
+    return report
+
+
+def main(argv=sys.argv):
+    opts = OptionParser(description='benchmark readers and splitters of magic3.linescan')\
+    .add('-s', '--size', type=int, metavar='MB', default=1024, help='size of generated log in MB')\
+    .add('-l', '--linelen', type=int, metavar='N', default=120, help='average line length')\
+    .add('-n', '--nfield', type=int, metavar='N', default=10, help='fields per line')\
+    .add('-d', '--delim', type=str, metavar='C', default=' ', help='field delimiter')\
+    .add('-b', '--bench', type=str, metavar='NAMES', default='', help='comma separated names, default all')\
+    .add('-f', '--file', type=str, metavar='FILE', default='', help='use existing file instead')\
+    .add('-k', '--keep', action='store_true', help='keep generated file')\
+    .add('-o', '--output', type=str, metavar='FILE', default='', help='write json report to file')\
+    .parse(argv)\
+    .options()
+
+    names = [s.strip() for s in opts['bench'].split(',') if s.strip()]
+    report = bench(opts['size'], opts['linelen'], opts['nfield'], opts['delim'], names,
+                   opts['file'], opts['keep'])
+    text = json.dumps(report, indent=4)
+    if opts['output']:
+        with open(opts['output'], 'w') as f:
+            f.write(text)
+    print(text)
+
+
+def test():
+    report = bench(size=2, linelen=80, nfield=8, names=['LineParserBase.binary', 'read_from_awk', 'file_count'])
+    counts = set(r['result'] for r in report['results'])
+    assert len(counts) == 1, report
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
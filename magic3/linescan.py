@@ -2,7 +2,9 @@
 # -*- coding:utf-8 -*-
 # author : cypro666
 # date   : 2015.06.06
-import os, re, math
+import os, re, math, json, time, random, struct, selectors, asyncio
+from array import array
+from subprocess import Popen, PIPE
 from _io import open, DEFAULT_BUFFER_SIZE, BytesIO
 from abc import abstractmethod, ABCMeta
 from os.path import exists
@@ -10,19 +12,23 @@ from string import Template
 from magic3.utils import debug
 from magic3.filesystem import user_dir, list_dir, PathSpliter
 from magic3.system import OSCommand
+from magic3.aiowraps import aio_loop, aio_run
+from magic3.progressbar import ProgressBar
 
-AWK_CMD = Template('''awk -F "${delim}" '{print ${vargs}}' ${files} 2>&1''')
+AWK_PROG = Template('{print ${vargs}}')
 
 bestIOBufferSize = DEFAULT_BUFFER_SIZE << 2
 
+AWK_READ_SIZE = bestIOBufferSize << 5
+
 TWO_GB = (1024 * 1024 * 1024 * 2)
 
+LINE_INDEX_MAGIC = b'LIDX'
+LINE_INDEX_HEAD = struct.Struct('=4sIQqQ')
 
-def open_awk(filelist:list, pos_args:list, delim):
-    ''' Call awk command and return an opened pipe for read the output of awk, eg:
-        for line in open_awk([file1, file2], [2,3,4], ',').stdout:
-            print(line)   
-    '''
+
+def awk_argv(filelist:list, pos_args:list, delim) -> list:
+    ''' Check args and build argv of awk, no shell involved, so names and delim need no quoting '''
     if isinstance(delim, (bytes, bytearray)):
         delim = str(delim, 'utf-8')
 
@@ -45,32 +51,125 @@ def open_awk(filelist:list, pos_args:list, delim):
         if isinstance(i, str) and not i.isdigit():
             raise TypeError(pos_args)
 
-    cmd = AWK_CMD.safe_substitute(delim=delim,
-                                  vargs=','.join(map(lambda x:'$' + str(x), pos_args)),
-                                  files=' '.join(filelist))
+    prog = AWK_PROG.substitute(vargs=','.join(map(lambda x:'$' + str(x), pos_args)))
+    # relative names like '-x' or 'a=b' would be taken by awk as option or assignment
+    files = [fn if fn.startswith(os.sep) else os.path.join(os.curdir, fn) for fn in filelist]
+    return ['awk', '-F', delim, prog] + files
+
+
+def open_awk(filelist:list, pos_args:list, delim) -> Popen:
+    ''' Call awk command and return an opened pipe for read the output of awk, eg:
+        for line in open_awk([file1, file2], [2,3,4], ',').stdout:
+            print(line)   
+    '''
+    argv = awk_argv(filelist, pos_args, delim)
     if __debug__:
-        print(cmd)
+        debug(argv)
+
+    return Popen(argv, bufsize=AWK_READ_SIZE, stdout=PIPE, stderr=PIPE)
+
 
-    return OSCommand.popen(cmd)
+def _checked_lines(proc:Popen) -> iter:
+    ''' Yield lines of awk output, raise RuntimeError if awk exits abnormally '''
+    with proc:
+        yield from proc.stdout
+        err = proc.stderr.read()
+    if proc.returncode:
+        raise RuntimeError('awk exit %d: %s' % (proc.returncode, err.decode('utf-8', 'replace').strip()))
 
 
 def read_from_awk(filelist:list, pos_args:list, delim=' ') -> iter:
     ''' Call awk command and return an iterator for reading the output of awk '''
-    reader = open_awk(filelist, pos_args, delim).stdout
-    if reader.readable() and not reader.closed:
-        return iter(reader)
+    proc = open_awk(filelist, pos_args, delim)
+    if proc.stdout.readable() and not proc.stdout.closed:
+        return _checked_lines(proc)
     else:
         raise RuntimeError('open_awk failed')
 
 def read_from_awk_with_callback(callback, filelist:list, pos_args:list, delim=' ') -> iter:
     ''' Call awk command and return an iterator of callback's return for each line in output '''
-    reader = open_awk(filelist, pos_args, delim).stdout
-    if reader.readable() and not reader.closed:
-        return map(callback, reader)
+    proc = open_awk(filelist, pos_args, delim)
+    if proc.stdout.readable() and not proc.stdout.closed:
+        return map(callback, _checked_lines(proc))
     else:
         raise RuntimeError('open_awk failed')
 
 
+def iter_awk_parallel(filelist:list, pos_args:list, delim=' ', maxproc=None) -> iter:
+    ''' Run one awk per file and at most `maxproc` at once, merge their stdout by selectors and
+        yield (filename, lines) as soon as any awk has output, lines have no line ending and
+        keep the order within each file, RuntimeError raised if any awk exits abnormally
+    '''
+    awk_argv(filelist, pos_args, delim)
+    if not maxproc:
+        maxproc = os.cpu_count() or 1
+    pending = list(reversed(filelist))
+    running = {}
+    sel = selectors.DefaultSelector()
+
+    def spawn():
+        fn = pending.pop()
+        proc = open_awk([fn], pos_args, delim)
+        running[proc] = [fn, b'', []]
+        sel.register(proc.stdout, selectors.EVENT_READ, (proc, 1))
+        sel.register(proc.stderr, selectors.EVENT_READ, (proc, 2))
+
+    try:
+        while pending and len(running) < maxproc:
+            spawn()
+
+        while running:
+            for key, _ in sel.select():
+                proc, which = key.data
+                state = running.get(proc)
+                if state is None:
+                    continue
+                buf = os.read(key.fd, AWK_READ_SIZE)
+                if which == 2:
+                    if buf:
+                        state[2].append(buf)
+                    else:
+                        sel.unregister(key.fileobj)
+                    continue
+
+                if buf:
+                    buf = state[1] + buf
+                    end = buf.rfind(b'\n') + 1
+                    state[1] = buf[end:]
+                    if end:
+                        lines = buf[:end - 1].split(b'\n')
+                        yield state[0], lines
+                    continue
+
+                sel.unregister(key.fileobj)
+                if state[1]:
+                    yield state[0], [state[1]]
+                try:
+                    sel.unregister(proc.stderr)
+                except KeyError:
+                    pass
+                err = b''.join(state[2]) + proc.stderr.read()
+                proc.stdout.close()
+                proc.stderr.close()
+                del running[proc]
+                if proc.wait():
+                    raise RuntimeError('awk exit %d on %s: %s' % (proc.returncode, state[0],
+                                       err.decode('utf-8', 'replace').strip()))
+                if pending:
+                    spawn()
+    finally:
+        for proc in running:
+            proc.kill()
+            proc.wait()
+        sel.close()
+
+
+def read_from_awk_parallel(filelist:list, pos_args:list, delim=' ', maxproc=None) -> iter:
+    ''' Like read_from_awk, but one awk per file in parallel, see iter_awk_parallel '''
+    for _, lines in iter_awk_parallel(filelist, pos_args, delim, maxproc):
+        yield from lines
+
+
 def open_as_bytes_stream(filename):
     ''' If filesize < TWO_GB, read whole file as BytesIO object '''
     filesize = os.path.getsize(filename)
@@ -81,9 +180,129 @@ def open_as_bytes_stream(filename):
         return open(filename, 'rb', buffering=bestIOBufferSize)
 
 
+class LineFilter(object):
+    ''' Select lines from a whole block instead of splitting it, `pattern` is a literal(bytes/str)
+        or a compiled regex, a literal matches anywhere in the line or only at the beginning if
+        `prefix` is True, a regex is searched over the block, so use re.M for `^` and `$`, eg:
+        class Parser(LineParserBase):
+            line_filter = LineFilter(b'ERROR')
+    '''
+
+    def __init__(self, pattern, prefix=False, encoding='utf-8'):
+        self._literal = None
+        self._regex = None
+        self._prefix = prefix
+        if isinstance(pattern, str):
+            pattern = pattern.encode(encoding)
+        if isinstance(pattern, (bytes, bytearray)):
+            self._literal = bytes(pattern)
+        elif hasattr(pattern, 'search'):
+            if isinstance(pattern.pattern, str):
+                pattern = re.compile(pattern.pattern.encode(encoding), pattern.flags & ~re.UNICODE)
+            self._regex = pattern
+        else:
+            raise TypeError(pattern)
+
+    def select(self, body:bytes) -> list:
+        ''' Return matched lines of `body`, which is complete lines without the last line ending '''
+        if not self._regex and not self._literal:
+            return body.split(b'\n')
+
+        out = []
+        append = out.append
+        find = body.find
+        size = len(body)
+
+        if self._regex:
+            search = self._regex.search
+            m = search(body)
+            while m:
+                pos = m.start()
+                begin = body.rfind(b'\n', 0, pos) + 1
+                end = find(b'\n', pos)
+                if end < 0:
+                    end = size
+                # a match may run over the line ending, so search the line alone again
+                if m.end() <= end or search(body, begin, end):
+                    append(body[begin:end])
+                if end >= size:
+                    break
+                m = search(body, end + 1)
+
+        elif self._prefix:
+            lit = self._literal
+            if body.startswith(lit):
+                end = find(b'\n')
+                append(body if end < 0 else body[:end])
+            needle = b'\n' + lit
+            pos = find(needle)
+            while pos >= 0:
+                end = find(b'\n', pos + 1)
+                if end < 0:
+                    append(body[pos + 1:])
+                    break
+                append(body[pos + 1:end])
+                pos = find(needle, end)
+
+        else:
+            lit = self._literal
+            pos = find(lit)
+            while pos >= 0:
+                end = find(b'\n', pos)
+                if end < 0:
+                    end = size
+                append(body[body.rfind(b'\n', 0, pos) + 1:end])
+                if end >= size:
+                    break
+                pos = find(lit, end + 1)
+
+        return out
+
+
+class LineMetrics(object):
+    ''' Throughput of one file read by LineParserBase, updated once per block '''
+    __slots__ = ('filename', 'filesize', 'nbytes', 'nlines', 'io_time', 'parse_time',
+                 'start', 'elapsed', 'finished')
+
+    def __init__(self, filename, filesize=0):
+        self.filename = filename
+        self.filesize = filesize
+        self.nbytes = 0
+        self.nlines = 0
+        self.io_time = 0.0
+        self.parse_time = 0.0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        self.finished = False
+
+    @property
+    def lines_per_sec(self) -> float:
+        return self.nlines / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.nbytes / 1048576.0 / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        d = {k:getattr(self, k) for k in self.__slots__ if k != 'start'}
+        d['lines_per_sec'] = self.lines_per_sec
+        d['mb_per_sec'] = self.mb_per_sec
+        return d
+
+    def __repr__(self):
+        return '%s(%r, %d lines, %.2f MB/s, io %.3fs, parse %.3fs)' % (self.__class__.__name__,
+               self.filename, self.nlines, self.mb_per_sec, self.io_time, self.parse_time)
+
+
 class LineParserBase(metaclass=ABCMeta):
     ''' Inherit this class and implement `run` and `parse_line` method '''
 
+    _monitor = None
+    _blocksize = bestIOBufferSize << 5
+
+    # set as LineFilter to parse only matched lines
+    line_filter = None
+
     def __init__(self, filenames=[], filedir='', namefilter='.*'):
         self._files = filenames if filenames else []
         self._dir = filedir
@@ -110,7 +329,82 @@ class LineParserBase(metaclass=ABCMeta):
 
         return self._files
 
+    @property
+    def files(self) -> tuple:
+        return self._files
+
+    def set_monitor(self, callback, blocksize=bestIOBufferSize << 5):
+        ''' Read by blocks of `blocksize` and call `callback(metrics)` after each block and at
+            the end of each file, `metrics` is a LineMetrics, set None to disable '''
+        self._monitor = callback
+        self._blocksize = blocksize
+        self.metrics = []
+
+    def set_filter(self, pattern, prefix=False):
+        ''' Parse only lines matched, see LineFilter, set None to disable '''
+        self.line_filter = LineFilter(pattern, prefix) if pattern is not None else None
+
+    def split_block(self, buf:bytes) -> tuple:
+        ''' Split block into complete lines without line ending(only matched ones if
+            `line_filter` is set) and the incomplete rest '''
+        end = buf.rfind(b'\n') + 1
+        if not end:
+            return [], buf
+        if self.line_filter:
+            return self.line_filter.select(buf[:end - 1]), buf[end:]
+        return buf[:end - 1].split(b'\n'), buf[end:]
+
+    def read_blocks(self, fn, mode='rb', encoding='utf-8-sig', errors='replace'):
+        ''' Same as read, but by blocks, used when monitor or line_filter is set '''
+        monitor = self._monitor
+        metrics = LineMetrics(fn, os.path.getsize(fn))
+        if monitor:
+            self.metrics.append(metrics)
+        parser_ = self.parse_line
+        binary = 'b' in mode
+        clock = time.perf_counter
+        rest = b''
+
+        with open(fn, 'rb', buffering=0) as f:
+            while True:
+                t0 = clock()
+                buf = f.read(self._blocksize)
+                t1 = clock()
+                metrics.io_time += t1 - t0
+                if not buf:
+                    break
+                metrics.nbytes += len(buf)
+                lines, rest = self.split_block(rest + buf if rest else buf)
+                if binary:
+                    for line in lines:
+                        parser_(line.rstrip())
+                else:
+                    for line in lines:
+                        parser_(line.decode(encoding, errors).rstrip())
+                t2 = clock()
+                metrics.parse_time += t2 - t1
+                metrics.nlines += len(lines)
+                metrics.elapsed = t2 - metrics.start
+                if monitor:
+                    monitor(metrics)
+
+        if rest:
+            t1 = clock()
+            lines = self.line_filter.select(rest) if self.line_filter else [rest]
+            for line in lines:
+                parser_(line.rstrip() if binary else line.decode(encoding, errors).rstrip())
+            metrics.parse_time += clock() - t1
+            metrics.nlines += len(lines)
+
+        metrics.elapsed = clock() - metrics.start
+        metrics.finished = True
+        if monitor:
+            monitor(metrics)
+
     def read(self, fn, mode='rb', encoding='utf-8-sig', errors='replace'):
+        if self._monitor or self.line_filter:
+            return self.read_blocks(fn, mode, encoding, errors)
+
         bufsize = bestIOBufferSize
         parser_ = self.parse_line
 
@@ -135,6 +429,41 @@ class LineParserBase(metaclass=ABCMeta):
         self.read_all()
 
 
+class LineProgress(object):
+    ''' Monitor callback driving a ProgressBar by byte offsets of all files, eg:
+        parser.set_monitor(LineProgress(parser.files))
+        parser.run()
+        `callback` is also called with metrics if given
+    '''
+
+    def __init__(self, filenames, pbar=None, callback=None):
+        total = sum(os.path.getsize(fn) for fn in filenames)
+        if pbar:
+            pbar.maxValue = max(total, 1)
+        else:
+            pbar = ProgressBar(maxValue=max(total, 1))
+        self._pbar = pbar
+        self._callback = callback
+        self._left = len(filenames)
+        self._done = 0
+        self._pbar.start()
+
+    def __call__(self, metrics:LineMetrics):
+        if self._callback:
+            self._callback(metrics)
+        pbar = self._pbar
+        if metrics.finished:
+            self._done += metrics.nbytes
+            self._left -= 1
+            if self._left <= 0:
+                pbar.finish()
+                return
+            value = self._done
+        else:
+            value = self._done + metrics.nbytes
+        pbar.update(min(value, pbar.maxValue))
+
+
 class AWKLineParserBase(LineParserBase):
     ''' Like LineParserBase, this class using awk subprocess for formatted text file, such as log file
         tip: str.split of python always very slow, if there're many fields each line, using this solution
@@ -161,10 +490,462 @@ class AWKLineParserBase(LineParserBase):
                 debug(each)
             self.read(each)
 
-    def run(self, fields:list, delim:str=' '):
+    def read_all_parallel(self, maxproc=None):
+        ''' One awk per file and at most `maxproc` at once, lines of different files interleave '''
+        delimb = bytes(self._delim, 'utf-8')
+        parser_ = self.parse_line
+        for _, lines in iter_awk_parallel(self._files, self._fields, self._delim, maxproc):
+            for line in lines:
+                parser_(line.rstrip().split(delimb))
+
+    def run(self, fields:list, delim:str=' ', maxproc=1):
+        ''' Files are read in series if `maxproc` is 1, else see read_all_parallel '''
         self._fields = tuple(fields)
         self._delim = delim
+        if maxproc == 1:
+            self.read_all()
+        else:
+            self.read_all_parallel(maxproc)
+
+
+async def open_pipe_reader(pipe, limit=AWK_READ_SIZE) -> asyncio.StreamReader:
+    ''' Wrap readable pipe(eg: stdout of Popen) as asyncio.StreamReader '''
+    loop = aio_loop()
+    reader = asyncio.StreamReader(limit=limit, loop=loop)
+    await loop.connect_read_pipe(lambda:asyncio.StreamReaderProtocol(reader, loop=loop), pipe)
+    return reader
+
+
+class AsyncLineParserBase(LineParserBase):
+    ''' Asyncio variant of LineParserBase, files are read by blocks in executor, pipes and sockets
+        through asyncio.StreamReader, all sources are parsed concurrently in one event loop,
+        `parse_line` can be a coroutine function, only one block of each source is read ahead
+        of parsing, so a slow parser throttles reading, eg:
+        class Parser(AsyncLineParserBase):
+            async def parse_line(self, line):
+                await queue.put(line)
+        Parser(filenames=['a.log', 'b.log']).run()
+    '''
+
+    def __init__(self, filenames=[], filedir='', namefilter='.*', blocksize=bestIOBufferSize << 3):
+        if filenames or filedir:
+            super().__init__(filenames=filenames, filedir=filedir, namefilter=namefilter)
+        else:
+            # streams only
+            self._files, self._dir, self._filter = (), '', re.compile(namefilter)
+        self._blocksize = blocksize
+
+    @staticmethod
+    def _make_batch(lines, mode, encoding, errors) -> list:
+        if 'b' in mode:
+            return [line.rstrip() for line in lines]
+        return [line.decode(encoding, errors).rstrip() for line in lines]
+
+    async def iter_file(self, fn, mode='rb', encoding='utf-8-sig', errors='replace'):
+        ''' Async generator of line batches of file, next block is read in executor while the
+            current batch is being parsed '''
+        loop = aio_loop()
+        f = open(fn, 'rb', buffering=0)
+        pending = loop.run_in_executor(None, f.read, self._blocksize)
+        rest = b''
+        try:
+            while True:
+                buf = await pending
+                if not buf:
+                    break
+                pending = loop.run_in_executor(None, f.read, self._blocksize)
+                lines, rest = self.split_block(rest + buf if rest else buf)
+                if lines:
+                    yield self._make_batch(lines, mode, encoding, errors)
+            if rest:
+                lines = self.line_filter.select(rest) if self.line_filter else [rest]
+                if lines:
+                    yield self._make_batch(lines, mode, encoding, errors)
+        finally:
+            # never close the file under a running read
+            pending.add_done_callback(lambda _:f.close())
+
+    async def iter_stream(self, reader:asyncio.StreamReader, mode='rb', encoding='utf-8', errors='replace'):
+        ''' Async generator of line batches of StreamReader, eg: from asyncio.open_connection,
+            asyncio.create_subprocess_exec or open_pipe_reader '''
+        rest = b''
+        while True:
+            buf = await reader.read(self._blocksize)
+            if not buf:
+                break
+            lines, rest = self.split_block(rest + buf if rest else buf)
+            if lines:
+                yield self._make_batch(lines, mode, encoding, errors)
+        if rest:
+            lines = self.line_filter.select(rest) if self.line_filter else [rest]
+            if lines:
+                yield self._make_batch(lines, mode, encoding, errors)
+
+    async def feed(self, batches):
+        ''' Parse all batches, yield to other sources after each batch '''
+        parser_ = self.parse_line
+        if asyncio.iscoroutinefunction(parser_):
+            async for lines in batches:
+                for line in lines:
+                    await parser_(line)
+                await asyncio.sleep(0)
+        else:
+            async for lines in batches:
+                for line in lines:
+                    parser_(line)
+                await asyncio.sleep(0)
+
+    async def read(self, fn, mode='rb', encoding='utf-8-sig', errors='replace'):
+        await self.feed(self.iter_file(fn, mode, encoding, errors))
+
+    async def read_stream(self, reader, mode='rb', encoding='utf-8', errors='replace'):
+        await self.feed(self.iter_stream(reader, mode, encoding, errors))
+
+    async def read_all(self, mode='rb', encoding='utf-8-sig', streams=()):
+        ''' Read all files and StreamReaders in `streams` concurrently '''
+        tasks = [self.read(each, mode, encoding) for each in self._files]
+        tasks.extend(self.read_stream(each, mode, encoding) for each in streams)
+        if __debug__:
+            debug(self._files, len(streams))
+        await asyncio.gather(*tasks)
+
+    def run(self, loop=None):
+        aio_run(self.read_all(), loop=loop)
+
+
+class LineCheckpoint(object):
+    ''' Persistent (inode, offset) progress of each file, saved as json like:
+        {"/var/log/app.log": [1835012, 409600]}
+    '''
+
+    def __init__(self, filename):
+        self._fname = filename
+        self._state = {}
+        self.load()
+
+    def load(self) -> dict:
+        if exists(self._fname):
+            with open(self._fname, 'r', encoding='utf-8') as f:
+                self._state = {k:tuple(v) for k, v in json.load(f).items()}
+        return self._state
+
+    def save(self):
+        ''' Write to a temp file then rename, so a crash never leaves a broken checkpoint '''
+        tmp = self._fname + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(tmp, self._fname)
+
+    def get(self, fn) -> tuple:
+        return self._state.get(os.path.abspath(fn), (0, 0))
+
+    def set(self, fn, inode, offset):
+        self._state[os.path.abspath(fn)] = (inode, offset)
+
+    def __contains__(self, fn):
+        return os.path.abspath(fn) in self._state
+
+
+class TailLineParserBase(LineParserBase):
+    ''' Like LineParserBase, but only parse lines appended since last run, the (inode, offset) of
+        each file is saved into `checkpoint` after run, rotated or truncated files are read from
+        the beginning, an incomplete last line is left to next run
+    '''
+
+    def __init__(self, filenames=[], filedir='', namefilter='.*', checkpoint=''):
+        super().__init__(filenames=filenames, filedir=filedir, namefilter=namefilter)
+        if not checkpoint:
+            raise ValueError('checkpoint')
+        self._ckpt = LineCheckpoint(checkpoint)
+        self._following = False
+
+    @property
+    def checkpoint(self) -> LineCheckpoint:
+        return self._ckpt
+
+    @staticmethod
+    def find_rotated(fn, inode):
+        ''' Search siblings like `fn.1` or `fn-20150606` for the file still owning `inode` '''
+        dirname, basename = os.path.split(os.path.abspath(fn))
+        for name in os.listdir(dirname):
+            if name == basename or not name.startswith(basename):
+                continue
+            path = os.path.join(dirname, name)
+            try:
+                if os.stat(path).st_ino == inode:
+                    return path
+            except OSError:
+                pass
+        return None
+
+    def read_from(self, f, offset, mode='rb', encoding='utf-8-sig', errors='replace') -> int:
+        ''' Parse complete lines of opened file `f` from `offset`, return offset after last line '''
+        parser_ = self.parse_line
+        binary = 'b' in mode
+        rest = b''
+        f.seek(offset)
+
+        while True:
+            buf = f.read(bestIOBufferSize)
+            if not buf:
+                break
+            if rest:
+                buf = rest + buf
+            lines, rest = self.split_block(buf)
+            if binary:
+                for line in lines:
+                    parser_(line.rstrip())
+            else:
+                for line in lines:
+                    parser_(line.decode(encoding, errors).rstrip())
+            offset += len(buf) - len(rest)
+
+        return offset
+
+    def read(self, fn, mode='rb', encoding='utf-8-sig', errors='replace'):
+        inode, offset = self._ckpt.get(fn)
+
+        try:
+            f = open(fn, 'rb', buffering=0)
+        except FileNotFoundError:
+            # rotation in progress, drain the old file and wait for the new one
+            old = self.find_rotated(fn, inode) if inode else None
+            if old:
+                with open(old, 'rb', buffering=0) as fold:
+                    offset = self.read_from(fold, offset, mode, encoding, errors)
+                self._ckpt.set(fn, inode, offset)
+            return
+
+        with f:
+            st = os.fstat(f.fileno())
+            if inode and inode != st.st_ino:
+                # rotated, finish the tail of old file first if it is still around
+                old = self.find_rotated(fn, inode)
+                if old:
+                    if __debug__:
+                        debug('rotated', old)
+                    with open(old, 'rb', buffering=0) as fold:
+                        self.read_from(fold, offset, mode, encoding, errors)
+                offset = 0
+            elif st.st_size < offset:
+                # truncated in place
+                offset = 0
+            offset = self.read_from(f, offset, mode, encoding, errors)
+
+        self._ckpt.set(fn, st.st_ino, offset)
+
+    def run(self):
         self.read_all()
+        self._ckpt.save()
+
+    def follow(self, interval=1.0, times=None):
+        ''' Poll files every `interval` seconds and parse appended lines until `stop` called
+            or polled `times` times, checkpoint is saved after each round '''
+        self._following = True
+        while self._following:
+            self.run()
+            if times is not None:
+                times -= 1
+                if times <= 0:
+                    break
+            time.sleep(interval)
+        self._following = False
+
+    def stop(self):
+        self._following = False
+
+
+class LineIndex(object):
+    ''' Record byte offset of every `step` lines of a text file in a sidecar file (default is
+        `filename + '.lidx'`), the sidecar is validated by size and mtime and rebuilt if stale,
+        any line can then be reached by one seek and at most `step` readline, eg:
+        index = LineIndex('/data/huge.log')
+        print(len(index), index.get_line(200000000))
+        for line in index.lines(100, 200):
+            print(line)
+    '''
+
+    def __init__(self, filename, step=1024, indexfile=None, rebuild=False):
+        assert exists(filename)
+        if step <= 0:
+            raise ValueError('step must be positive')
+        self._fname = filename
+        self._step = step
+        self._indexfile = indexfile if indexfile else filename + '.lidx'
+        self._offsets = array('Q')
+        self._nline = 0
+        self._size = 0
+        self._fh = None
+        if rebuild or not self.load():
+            self.build()
+            self.save()
+
+    def __len__(self):
+        return self._nline
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excinst, exctb):
+        self.close()
+
+    @property
+    def step(self) -> int:
+        return self._step
+
+    @property
+    def offsets(self) -> array:
+        return self._offsets
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    def load(self) -> bool:
+        ''' Load sidecar index, return False if it is missing or stale '''
+        if not exists(self._indexfile):
+            return False
+        st = os.stat(self._fname)
+        with open(self._indexfile, 'rb') as f:
+            head = f.read(LINE_INDEX_HEAD.size)
+            if len(head) != LINE_INDEX_HEAD.size:
+                return False
+            magic, step, size, mtime, nline = LINE_INDEX_HEAD.unpack(head)
+            if magic != LINE_INDEX_MAGIC or step != self._step:
+                return False
+            if size != st.st_size or mtime != st.st_mtime_ns:
+                return False
+            offsets = array('Q')
+            offsets.frombytes(f.read())
+        self._offsets, self._nline, self._size = offsets, nline, size
+        return True
+
+    def save(self):
+        ''' Write sidecar index, header is followed by raw array('Q') '''
+        st = os.stat(self._fname)
+        tmp = self._indexfile + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(LINE_INDEX_HEAD.pack(LINE_INDEX_MAGIC, self._step, self._size,
+                                         st.st_mtime_ns, self._nline))
+            self._offsets.tofile(f)
+        os.replace(tmp, self._indexfile)
+
+    def build(self) -> array:
+        ''' Scan whole file once, blocks without an indexed line are only counted '''
+        step = self._step
+        offsets = array('Q', [0])
+        nline, base, target = 0, 0, step
+        lastbyte = b'\n'
+
+        with open(self._fname, 'rb', buffering=0) as f:
+            while True:
+                buf = f.read(bestIOBufferSize << 5)
+                if not buf:
+                    break
+                cnt = buf.count(b'\n')
+                if nline + cnt < target:
+                    nline += cnt
+                else:
+                    find = buf.find
+                    pos = find(b'\n')
+                    while pos >= 0:
+                        nline += 1
+                        if nline == target:
+                            offsets.append(base + pos + 1)
+                            target += step
+                        pos = find(b'\n', pos + 1)
+                base += len(buf)
+                lastbyte = buf[-1:]
+
+        if lastbyte != b'\n':
+            nline += 1
+        while offsets and offsets[-1] >= base:
+            offsets.pop()
+
+        self._offsets, self._nline, self._size = offsets, nline, base
+        return offsets
+
+    def _file(self):
+        if not self._fh:
+            self._fh = open(self._fname, 'rb', buffering=bestIOBufferSize)
+        return self._fh
+
+    def _check(self, n) -> int:
+        if n < 0:
+            n += self._nline
+        if not 0 <= n < self._nline:
+            raise IndexError(n)
+        return n
+
+    def seek_line(self, f, n):
+        ''' Move opened file `f` to the beginning of line `n` '''
+        f.seek(self._offsets[n // self._step])
+        readline = f.readline
+        for _ in range(n % self._step):
+            readline()
+
+    def get_line(self, n) -> bytes:
+        ''' Get line `n`(0-based) without line ending '''
+        n = self._check(n)
+        f = self._file()
+        self.seek_line(f, n)
+        return f.readline().rstrip(b'\r\n')
+
+    __getitem__ = get_line
+
+    def lines(self, start, stop=None) -> iter:
+        ''' Iterate lines in [start, stop) without line ending '''
+        if stop is None or stop > self._nline:
+            stop = self._nline
+        if start >= stop:
+            return
+        start = self._check(start)
+        with open(self._fname, 'rb', buffering=bestIOBufferSize) as f:
+            self.seek_line(f, start)
+            readline = f.readline
+            for _ in range(stop - start):
+                yield readline().rstrip(b'\r\n')
+
+    def sample(self, k) -> list:
+        ''' Random sample `k` lines, return list of (lineno, line) sorted by lineno '''
+        f = self._file()
+        result = []
+        for n in sorted(random.sample(range(self._nline), k)):
+            self.seek_line(f, n)
+            result.append((n, f.readline().rstrip(b'\r\n')))
+        return result
+
+    def ranges(self, nparts) -> list:
+        ''' Split file into at most `nparts` line-exact parts for parallel workers, return list of
+            (first_line, stop_line, begin_offset, end_offset) '''
+        if nparts <= 0:
+            raise ValueError('nparts must be positive')
+        if not self._nline:
+            return []
+        nblock = len(self._offsets)
+        bounds = sorted(set(nblock * i // nparts for i in range(nparts)))
+        result = []
+        for i, b in enumerate(bounds):
+            if i + 1 < len(bounds):
+                nxt = bounds[i + 1]
+                result.append((b * self._step, nxt * self._step, self._offsets[b], self._offsets[nxt]))
+            else:
+                result.append((b * self._step, self._nline, self._offsets[b], self._size))
+        return result
+
+    def read_range(self, begin, end) -> iter:
+        ''' Iterate lines between byte offsets, use with `ranges` '''
+        with open(self._fname, 'rb', buffering=bestIOBufferSize) as f:
+            f.seek(begin)
+            readline = f.readline
+            pos = begin
+            while pos < end:
+                line = readline()
+                if not line:
+                    break
+                pos += len(line)
+                yield line.rstrip(b'\r\n')
 
 
 def file_count(textfile:str) -> tuple:
@@ -287,10 +1068,39 @@ def test():
     p1.run()
     print(p1.count)
 
+    class GrepParser(Parser):
+        line_filter = LineFilter(b'def ')
+
+    p1g = GrepParser(__file__)
+    p1g.run()
+    with open(__file__, 'rb') as f:
+        expect = sum(len(line.split()) for line in f if b'def ' in line)
+    assert p1g.count == expect
+    p1g.set_filter(re.compile(r'^\s+def ', re.M))
+    p1g.count = 0
+    p1g.run()
+    regex = re.compile(rb'^\s+def ', re.M)
+    with open(__file__, 'rb') as f:
+        expect = sum(len(line.split()) for line in f if regex.search(line.rstrip(b'\n')))
+    assert p1g.count == expect
+    assert LineFilter(regex).select(b'x\n\n    def foo') == [b'    def foo']
+    assert LineFilter(regex).select(b'    def a\n\ndef b\n  def c') == [b'    def a', b'  def c']
+
+    from io import StringIO
+    p1m = Parser(__file__)
+    p1m.set_monitor(LineProgress(p1m.files, ProgressBar(fd=StringIO(), termWidth=40)), 1000)
+    p1m.run()
+    assert p1m.count == p1.count and p1m.metrics[0].finished
+    print(p1m.metrics[0])
+
     p2 = AWKParser(__file__)
     p2.run([3, 4, 5, 6])
     print(p2.count)
 
+    p2p = AWKParser(__file__)
+    p2p.run([3, 4, 5, 6], maxproc=None)
+    assert p2p.count == p2.count
+
     d = {}
     for line in read_from_awk([__file__, __file__, __file__], [2, 3]):
         for s in line.split():
@@ -300,6 +1110,44 @@ def test():
     for k, v in d.items():
         assert v >= 3
 
+    lines = list(read_from_awk_parallel([__file__, __file__, __file__], [2, 3], maxproc=2))
+    assert sorted(lines) == sorted(i.rstrip(b'\n') for i in read_from_awk([__file__] * 3, [2, 3]))
+
+    class AsyncParser(AsyncLineParserBase):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.count = 0
+        async def parse_line(self, line):
+            self.count += len([s for s in line.split() if len(s) >= 1])
+
+    from magic3.aiowraps import aio_new
+    loop = aio_new()
+    p4 = AsyncParser(filenames=[__file__], blocksize=1000)
+    p4.run(loop=loop)
+    assert p4.count == p1.count
+    p5 = AsyncParser()
+    stream = asyncio.StreamReader(loop=loop)
+    stream.feed_data(b'a b\nc')
+    stream.feed_eof()
+    loop.run_until_complete(p5.read_all(streams=[stream]))
+    assert p5.count == 3
+    p5.count = 0
+    p5.set_filter(b'ERROR')
+    stream = asyncio.StreamReader(loop=loop)
+    stream.feed_data(b'ERROR a\nINFO b c\nINFO d')
+    stream.feed_eof()
+    loop.run_until_complete(p5.read_all(streams=[stream]))
+    assert p5.count == 2
+    p5.set_filter(None)
+    p5.lines = []
+    p5.parse_line = lambda line: p5.lines.append(line)
+    stream = asyncio.StreamReader(loop=loop)
+    stream.feed_data('café\n'.encode('latin-1'))
+    stream.feed_eof()
+    loop.run_until_complete(p5.read_all('r', 'latin-1', streams=[stream]))
+    assert p5.lines == ['café']
+    loop.close()
+
     fspliter = FileSpliter(__file__)
     ret = fspliter.split_by_size(1000)
 
@@ -308,6 +1156,61 @@ def test():
     for fn in ret:
         os.system('unlink ' + fn)
 
+    class TailParser(TailLineParserBase):
+        def __init__(self, name, ckpt):
+            super().__init__(filenames=[name], checkpoint=ckpt)
+            self.lines = []
+        def parse_line(self, line):
+            self.lines.append(line)
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log, ckpt = os.path.join(tmpdir, 'app.log'), os.path.join(tmpdir, 'app.ckpt')
+        with open(log, 'wb') as f:
+            f.write(b'1\n2\n3')
+        p3 = TailParser(log, ckpt)
+        p3.run()
+        assert p3.lines == [b'1', b'2']
+        with open(log, 'ab') as f:
+            f.write(b'\n4\n')
+        p3 = TailParser(log, ckpt)
+        p3.follow(interval=0, times=2)
+        assert p3.lines == [b'3', b'4']
+        os.rename(log, log + '.1')
+        with open(log + '.1', 'ab') as f:
+            f.write(b'5\n')
+        with open(log, 'wb') as f:
+            f.write(b'6\n')
+        p3 = TailParser(log, ckpt)
+        p3.run()
+        assert p3.lines == [b'5', b'6']
+        os.rename(log, log + '.2')
+        with open(log + '.2', 'ab') as f:
+            f.write(b'7\n')
+        p3 = TailParser(log, ckpt)
+        p3.follow(interval=0, times=2)
+        assert p3.lines == [b'7']
+        with open(log + '.2', 'ab') as f:
+            f.write(b'8\n')
+        with open(log, 'wb') as f:
+            f.write(b'9\n')
+        p3.run()
+        assert p3.lines == [b'7', b'8', b'9']
+        with open(log, 'wb') as f:
+            f.write(b'')
+        p3.run()
+        assert p3.lines == [b'7', b'8', b'9']
+
+        with open(log, 'wb') as f:
+            f.write(b''.join(b'%d\n' % i for i in range(1000)))
+        with LineIndex(log, step=7) as index:
+            assert len(index) == 1000 and index.get_line(500) == b'500'
+            assert list(index.lines(698, 702)) == [b'698', b'699', b'700', b'701']
+            assert all(int(line) == n for n, line in index.sample(10))
+            parts = [line for r in index.ranges(3) for line in index.read_range(r[2], r[3])]
+            assert len(parts) == 1000 and parts[-1] == b'999'
+        assert LineIndex(log, step=7).get_line(-1) == b'999'
+
     print('test OK')
 
 